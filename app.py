@@ -1,14 +1,46 @@
 from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+import asyncio
 import random
 import uvicorn
-import numpy as np
-import math
-from pydantic import BaseModel
+import os
+import threading
+import multiprocessing
+import uuid
+import zlib
+from itertools import count
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
+from search_worker import (init_worker, ready, search_move, search_batch, ponder_move, OPENING_BOOK,
+                           MAX_SEARCH_DEPTH)
+from parallel_search import ParallelSearcher
+from opening_book import OpeningBook
+from solver import Solver
+from bitboard import (position_from_board, position_from_string, position_from_moves, position_from_key,
+                      COLUMN_COUNT)
+from windows import winning_move
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Start every worker now, so loading the search cache does not delay
+    # the first request each one serves
+    await asyncio.gather(*(asyncio.wrap_future(pool.submit(ready)) for pool in search_pools))
+    yield
+    # Let the workers finish and save their search cache
+    for stop in stop_events:
+        stop.set()
+    for pool in search_pools:
+        pool.shutdown(wait=True, cancel_futures=True)
+    if parallel_searcher is not None:
+        parallel_searcher.close()
+
 
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,176 +54,113 @@ app.add_middleware(
 EMPTY = 0
 PLAYER_PIECE = 1
 AI_PIECE = 2
-WINDOW_LENGTH = 4
-MAX_TABLE_SIZE = 1000000
 
-# Global dictionary for memoization
-transposition_table = {}
+# Search time budget in seconds, per server (env) and per request (GameState)
+SEARCH_TIME_BUDGET = float(os.environ.get("SEARCH_TIME_BUDGET", "1.0"))
+MAX_TIME_BUDGET = float(os.environ.get("MAX_TIME_BUDGET", "5.0"))
+
+# Searches run in SEARCH_WORKERS worker processes. At most
+# MAX_PENDING_SEARCHES may be running or queued, more requests get a 429,
+# and a search not answered within SEARCH_TIMEOUT seconds gets a 503
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", str(os.cpu_count() or 1)))
+MAX_PENDING_SEARCHES = int(os.environ.get("MAX_PENDING_SEARCHES", str(2 * SEARCH_WORKERS)))
+SEARCH_TIMEOUT = float(os.environ.get("SEARCH_TIMEOUT", str(MAX_TIME_BUDGET + 5.0)))
+
+# After answering a game with a game_id, its worker ponders the expected
+# reply for up to PONDER_TIME_BUDGET seconds (0 = off). Setting a worker's
+# stop event cancels its pondering whenever live work is sent to it.
+PONDER_TIME_BUDGET = float(os.environ.get("PONDER_TIME_BUDGET", "10.0"))
+
+# One single-process pool per worker, so every game id is always served by
+# the worker holding its session
+stop_events = [multiprocessing.Event() for _ in range(SEARCH_WORKERS)]
+search_pools = [
+    ProcessPoolExecutor(1, initializer=init_worker, initargs=(stop,)) for stop in stop_events
+]
+next_pool = count()
+search_slots = threading.BoundedSemaphore(MAX_PENDING_SEARCHES)
+
+# Requests with "parallel": true split one search over PARALLEL_WORKERS
+# processes (0 = off), one such search at a time. With
+# PARALLEL_DETERMINISTIC=1 the result of a given depth does not depend on
+# the number of workers or on timing.
+PARALLEL_WORKERS = int(os.environ.get("PARALLEL_WORKERS", "0"))
+PARALLEL_DETERMINISTIC = os.environ.get("PARALLEL_DETERMINISTIC", "0") == "1"
+parallel_searcher = None
+if PARALLEL_WORKERS > 0:
+    parallel_searcher = ParallelSearcher(
+        PARALLEL_WORKERS, deterministic=PARALLEL_DETERMINISTIC, solver=Solver(),
+        opening_book=OpeningBook(OPENING_BOOK) if os.path.exists(OPENING_BOOK) else None)
+parallel_lock = asyncio.Lock()
+
+# Largest number of positions accepted by the batch endpoint
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "256"))
 
 # Pydantic models
+# The board is sent as exactly one of: board (nested lists), board_string (42
+# characters 0/1/2, row by row from the top), moves (1-based columns
+# played from the empty board, e.g. "4453") or packed (Position.key()).
+# valid_moves may be left out and is then taken from the board; columns it
+# lists must be 0 to 6.
 class GameState(BaseModel):
-    board: List[List[int]]
+    board: Optional[List[List[int]]] = None
+    board_string: Optional[str] = None
+    moves: Optional[str] = None
+    packed: Optional[int] = None
     current_player: int
-    valid_moves: List[int]
+    valid_moves: Optional[List[int]] = None
     is_new_game: bool
+    time_budget: Optional[float] = Field(None, gt=0)
+    game_id: Optional[str] = None
+    parallel: bool = False
 
 class AIResponse(BaseModel):
     move: int
+    game_id: Optional[str] = None
 
-# Evaluation functions
-def evaluate_window(window, piece, row_index=None, col_start=None, board=None):
-    score = 0
-    opp_piece = PLAYER_PIECE if piece == AI_PIECE else AI_PIECE
-
-    def is_playable(col_offset):
-        if board is None or row_index is None or col_start is None:
-            return True
-        col = col_start + col_offset
-        if row_index == len(board) - 1:
-            return True
-        return board[row_index + 1][col] != EMPTY
-
-    if window.count(piece) == 4:
-        score += 100000
-    elif window.count(piece) == 3 and window.count(EMPTY) == 1:
-        empty_index = window.index(EMPTY)
-        if is_playable(empty_index):
-            score += 100
-    elif window.count(piece) == 2 and window.count(EMPTY) == 2:
-        score += 10
-
-    if window.count(opp_piece) == 4:
-        score -= 100000
-    elif window.count(opp_piece) == 3 and window.count(EMPTY) == 1:
-        empty_index = window.index(EMPTY)
-        if is_playable(empty_index):
-            score -= 80
-    elif window.count(opp_piece) == 2 and window.count(EMPTY) == 2:
-        score -= 5
-
-    return score
-
-def score_position(board, piece):
-    board_array = np.array(board)
-    score = 0
-    row_count = len(board)
-    column_count = len(board[0])
-    opp_piece = PLAYER_PIECE if piece == AI_PIECE else AI_PIECE
-
-    # Score center column
-    center_array = [int(i) for i in list(board_array[:, column_count//2])]
-    center_count = center_array.count(piece)
-    score += center_count * 3
-
-    # Score horizontal
-    for r in range(row_count):
-        row_array = [int(i) for i in list(board_array[r, :])]
-        for c in range(column_count - 3):
-            window = row_array[c:c + WINDOW_LENGTH]
-            score += evaluate_window(window, piece, row_index=r, col_start=c, board=board)
-
-    # Score vertical
-    for c in range(column_count):
-        col_array = [int(i) for i in list(board_array[:,c])]
-        for r in range(row_count-3):
-            window = col_array[r:r+WINDOW_LENGTH]
-            score += evaluate_window(window, piece)
-
-    # Score positive sloped diagonal
-    for r in range(row_count-3):
-        for c in range(column_count-3):
-            window = [board[r+i][c+i] for i in range(WINDOW_LENGTH)]
-            score += evaluate_window(window, piece)
-
-    # Score negative sloped diagonal
-    for r in range(row_count-3):
-        for c in range(column_count-3):
-            window = [board[r+3-i][c+i] for i in range(WINDOW_LENGTH)]
-            score += evaluate_window(window, piece)
-
-    # Prioritize positions by height
-    for c in range(column_count):
-        for r in range(row_count):
-            if board[r][c] == piece:
-                score += (r + 1) * 0.5
-
-    # Evaluate multi-directional threats
-    for c in range(column_count):
-        r = get_next_open_row(board, c)
-        if r == -1:  # Column is full
-            continue
-            
-        # Test placing our piece in this position
-        board_copy = [row[:] for row in board]
-        board_copy[r][c] = piece
-        
-        threat_directions = 0
-        
-        # Check horizontal threat
-        if c <= column_count - 4:
-            row_window = [board_copy[r][c+i] for i in range(WINDOW_LENGTH)]
-            if row_window.count(piece) == 3 and row_window.count(EMPTY) == 1:
-                threat_directions += 1
-        
-        # Check vertical threat
-        if r <= row_count - 4:
-            col_window = [board_copy[r+i][c] for i in range(WINDOW_LENGTH)]
-            if col_window.count(piece) == 3 and col_window.count(EMPTY) == 1:
-                threat_directions += 1
-        
-        # Check diagonal down-right threat
-        if c <= column_count - 4 and r <= row_count - 4:
-            diag_window = [board_copy[r+i][c+i] for i in range(WINDOW_LENGTH)]
-            if diag_window.count(piece) == 3 and diag_window.count(EMPTY) == 1:
-                threat_directions += 1
-        
-        # Check diagonal down-left threat
-        if c >= 3 and r <= row_count - 4:
-            diag_window = [board_copy[r+i][c-i] for i in range(WINDOW_LENGTH)]
-            if diag_window.count(piece) == 3 and diag_window.count(EMPTY) == 1:
-                threat_directions += 1
-        
-        # Score multi-directional threats highly
-        if threat_directions > 1:
-            score += 100 * threat_directions
-        
-        # Check opponent threats at this position
-        board_copy = [row[:] for row in board]
-        board_copy[r][c] = opp_piece
-        
-        opp_threat_directions = 0
-        
-        # Check horizontal opponent threat
-        if c <= column_count - 4:
-            row_window = [board_copy[r][c+i] for i in range(WINDOW_LENGTH)]
-            if row_window.count(opp_piece) == 3 and row_window.count(EMPTY) == 1:
-                opp_threat_directions += 1
-        
-        # Check vertical opponent threat
-        if r <= row_count - 4:
-            col_window = [board_copy[r+i][c] for i in range(WINDOW_LENGTH)]
-            if col_window.count(opp_piece) == 3 and col_window.count(EMPTY) == 1:
-                opp_threat_directions += 1
-        
-        # Check diagonal down-right opponent threat
-        if c <= column_count - 4 and r <= row_count - 4:
-            diag_window = [board_copy[r+i][c+i] for i in range(WINDOW_LENGTH)]
-            if diag_window.count(opp_piece) == 3 and diag_window.count(EMPTY) == 1:
-                opp_threat_directions += 1
-        
-        # Check diagonal down-left opponent threat
-        if c >= 3 and r <= row_count - 4:
-            diag_window = [board_copy[r+i][c-i] for i in range(WINDOW_LENGTH)]
-            if diag_window.count(opp_piece) == 3 and diag_window.count(EMPTY) == 1:
-                opp_threat_directions += 1
-        
-        # Prioritize defense if opponent has multiple threats
-        if opp_threat_directions > 1:
-            score -= 120 * opp_threat_directions
+class BatchPosition(BaseModel):
+    board: Optional[List[List[int]]] = None
+    board_string: Optional[str] = None
+    moves: Optional[str] = None
+    packed: Optional[int] = None
+    current_player: int
+
+class BatchRequest(BaseModel):
+    positions: List[BatchPosition]
+    time_budget: Optional[float] = Field(None, gt=0)
+    max_depth: Optional[int] = Field(None, ge=1, le=MAX_SEARCH_DEPTH)
+
+class BatchResult(BaseModel):
+    move: Optional[int]  # None for finished games
+    score: Optional[float]
+    depth: int
 
-    return score
+class BatchResponse(BaseModel):
+    results: List[BatchResult]
 
 # Game state functions
+def request_position(state):
+    """Position of a GameState or BatchPosition, whatever encoding it uses."""
+    if state.current_player not in (1, 2):
+        raise HTTPException(status_code=400, detail="current_player phải là 1 hoặc 2")
+    encodings = [state.board, state.board_string, state.moves, state.packed]
+    if sum(encoding is not None for encoding in encodings) > 1:
+        raise HTTPException(status_code=400, detail="Chỉ gửi một dạng bàn cờ")
+    try:
+        if state.board_string is not None:
+            return position_from_string(state.board_string)
+        if state.moves is not None:
+            # The player to move tells who made the first move
+            first_piece = state.current_player if len(state.moves) % 2 == 0 else 3 - state.current_player
+            return position_from_moves(state.moves, first_piece)
+        if state.packed is not None:
+            return position_from_key(state.packed)
+        if state.board is not None:
+            return position_from_board(state.board)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    raise HTTPException(status_code=400, detail="Thiếu bàn cờ")
+
 def get_valid_moves(board):
     column_count = len(board[0])
     return [col for col in range(column_count) if board[0][col] == EMPTY]
@@ -200,41 +169,6 @@ def is_terminal_node(board):
     valid_moves = get_valid_moves(board)
     return winning_move(board, PLAYER_PIECE) or winning_move(board, AI_PIECE) or len(valid_moves) == 0
 
-def manage_transposition_table():
-    global transposition_table
-    if len(transposition_table) > MAX_TABLE_SIZE:
-        transposition_table.clear()
-
-def winning_move(board, piece):
-    row_count = len(board)
-    column_count = len(board[0])
-    
-    # Check horizontal
-    for r in range(row_count):
-        for c in range(column_count-3):
-            if board[r][c] == piece and board[r][c+1] == piece and board[r][c+2] == piece and board[r][c+3] == piece:
-                return True
-
-    # Check vertical
-    for c in range(column_count):
-        for r in range(row_count-3):
-            if board[r][c] == piece and board[r+1][c] == piece and board[r+2][c] == piece and board[r+3][c] == piece:
-                return True
-
-    # Check positive diagonal
-    for r in range(row_count-3):
-        for c in range(column_count-3):
-            if board[r][c] == piece and board[r+1][c+1] == piece and board[r+2][c+2] == piece and board[r+3][c+3] == piece:
-                return True
-
-    # Check negative diagonal
-    for r in range(3, row_count):
-        for c in range(column_count-3):
-            if board[r][c] == piece and board[r-1][c+1] == piece and board[r-2][c+2] == piece and board[r-3][c+3] == piece:
-                return True
-    
-    return False
-
 def get_next_open_row(board, col):
     row_count = len(board)
     for r in range(row_count-1, -1, -1):
@@ -259,101 +193,130 @@ def print_board(board, last_move=None):
         row, col = last_move
         print(f"Quân cờ vừa rơi vào vị trí: Hàng {row+1}, Cột {col+1}")
 
-# Minimax algorithm implementation
-def sort_valid_moves_with_boards(valid_moves, board, piece):
-    scored_moves = []
-    for col in valid_moves:
-        row = get_next_open_row(board, col)
-        if row != -1:
-            board_copy = drop_piece(board, row, col, piece)
-            score = score_position(board_copy, piece)
-            scored_moves.append((col, score, board_copy))
-    scored_moves.sort(key=lambda x: x[1], reverse=True)
-    return scored_moves
-
-def minimax(board, depth, alpha, beta, maximizing_player):
-    valid_moves = get_valid_moves(board)
-    
-    # Convert board to hashable format
-    board_tuple = tuple(tuple(row) for row in board)
-    state_key = (board_tuple, depth, maximizing_player)
-
-    # Check transposition table
-    if state_key in transposition_table:
-        return transposition_table[state_key]
-
-    # Check terminal conditions
-    is_terminal = is_terminal_node(board)
-    if depth == 0 or is_terminal:
-        if is_terminal:
-            if winning_move(board, AI_PIECE):
-                result = (None, 10000000)
-            elif winning_move(board, PLAYER_PIECE):
-                result = (None, -1000000)
-            else:
-                result = (None, 0)
-        else:
-            result = (None, score_position(board, AI_PIECE))
-        transposition_table[state_key] = result
-        return result
-    
-    # Maximizing player (AI)    
-    if maximizing_player:
-        value = -math.inf
-        column = None
-        sorted_moves = sort_valid_moves_with_boards(valid_moves, board, AI_PIECE)
-        for col, _, board_copy in sorted_moves:
-            new_score = minimax(board_copy, depth-1, alpha, beta, False)[1]
-            if new_score > value:
-                value = new_score
-                column = col
-            alpha = max(alpha, value)
-            if alpha >= beta:
-                break
-        transposition_table[state_key] = (column, value)
-        return column, value
-    
-    # Minimizing player (opponent)
-    else:
-        value = math.inf
-        column = None
-        sorted_moves = sort_valid_moves_with_boards(valid_moves, board, PLAYER_PIECE)
-        for col, _, board_copy in sorted_moves:
-            new_score = minimax(board_copy, depth-1, alpha, beta, True)[1]
-            if new_score < value:
-                value = new_score
-                column = col
-            beta = min(beta, value)
-            if alpha >= beta:
-                break
-        transposition_table[state_key] = (column, value)
-        return column, value
+def worker_index(game_id):
+    """Index of the worker holding the session of ``game_id``."""
+    if game_id is None:
+        return next(next_pool) % len(search_pools)
+    return zlib.crc32(game_id.encode()) % len(search_pools)
+
+def acquire_slots(count):
+    """Reserve ``count`` search slots or answer 429."""
+    for acquired in range(count):
+        if not search_slots.acquire(blocking=False):
+            for _ in range(acquired):
+                search_slots.release()
+            raise HTTPException(status_code=429, detail="Máy chủ đang bận, vui lòng thử lại sau")
+
+async def run_in_worker(index, timeout, fn, *args):
+    """Run ``fn`` in worker ``index`` holding a reserved slot, without
+    blocking the event loop."""
+    # Live work first: stop pondering
+    stop_events[index].set()
+    try:
+        future = search_pools[index].submit(fn, *args)
+    except (BrokenProcessPool, RuntimeError):
+        search_slots.release()
+        raise HTTPException(status_code=503, detail="Không thể tìm kiếm lúc này")
+    # The slot is freed when the search ends, even after a timeout
+    future.add_done_callback(lambda _: search_slots.release())
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Hết thời gian tìm kiếm")
+    except BrokenProcessPool:
+        raise HTTPException(status_code=503, detail="Không thể tìm kiếm lúc này")
+
+async def run_search(board, ai_piece, time_budget, game_id=None, new_game=False):
+    """Run ``search_move`` in a worker process without blocking the event loop."""
+    acquire_slots(1)
+    index = worker_index(game_id)
+    result = await run_in_worker(index, SEARCH_TIMEOUT, search_move,
+                                 board, ai_piece, time_budget, game_id, new_game)
+    if game_id is not None and PONDER_TIME_BUDGET > 0:
+        # Not awaited and not counted as a search slot: pondering gives way
+        # to any live request
+        try:
+            search_pools[index].submit(ponder_move, game_id, PONDER_TIME_BUDGET)
+        except (BrokenProcessPool, RuntimeError):
+            pass
+    return result
+
+async def run_parallel_search(position, ai_piece, time_budget):
+    """Search with all PARALLEL_WORKERS processes, in a thread so the event
+    loop keeps serving. Games searched this way have no session."""
+    def search():
+        col, score, depth = parallel_searcher.iterative_deepening(
+            position, ai_piece, time_budget, MAX_SEARCH_DEPTH)
+        return col, score, depth, parallel_searcher.solved, [col]
+
+    # Queued parallel requests wait for the lock without holding a search
+    # slot, and no longer than a search may take
+    try:
+        await asyncio.wait_for(parallel_lock.acquire(), SEARCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Hết thời gian tìm kiếm")
+    try:
+        acquire_slots(1)
+    except HTTPException:
+        parallel_lock.release()
+        raise
+    # The parallel search needs every core: stop pondering
+    for stop in stop_events:
+        stop.set()
+    task = asyncio.create_task(asyncio.to_thread(search))
+
+    def finished(task):
+        # Only when the thread is done may the next search use the searcher,
+        # even after a timeout
+        parallel_lock.release()
+        search_slots.release()
+        if not task.cancelled():
+            task.exception()
+
+    task.add_done_callback(finished)
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), SEARCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Hết thời gian tìm kiếm")
+    except BrokenProcessPool:
+        raise HTTPException(status_code=503, detail="Không thể tìm kiếm lúc này")
+
+async def run_batch(positions, time_budget, max_depth):
+    """Split ``positions`` over all workers, returns [(column, score, depth)]."""
+    workers = min(len(search_pools), len(positions))
+    size = -(-len(positions) // workers)
+    chunks = [positions[i:i + size] for i in range(0, len(positions), size)]
+    acquire_slots(len(chunks))
+    results = await asyncio.gather(*(
+        run_in_worker(index, len(chunk) * time_budget + SEARCH_TIMEOUT, search_batch,
+                      chunk, time_budget, max_depth)
+        for index, chunk in enumerate(chunks)
+    ))
+    return [result for chunk in results for result in chunk]
 
 # API endpoint
 @app.post("/api/connect4-move")
 async def make_move(game_state: GameState) -> AIResponse:
+    position = request_position(game_state)
+    board = position.to_board()
+    valid_moves = game_state.valid_moves
+    if valid_moves is None:
+        valid_moves = position.get_valid_moves()
+    elif any(not 0 <= col < COLUMN_COUNT for col in valid_moves):
+        raise HTTPException(status_code=400, detail=f"valid_moves phải là các cột từ 0 đến {COLUMN_COUNT - 1}")
     try:
-        if not game_state.valid_moves:
+        if not valid_moves:
             raise ValueError("Không có nước đi hợp lệ")
         
-        # Get current game state
-        board = game_state.board
-        valid_moves = game_state.valid_moves
-        
-        # Xử lý khi bắt đầu ván mới
+        # Xử lý khi bắt đầu ván mới: chỉ làm mới phiên của ván này
+        game_id = game_state.game_id
         if game_state.is_new_game:
-            # Reset transposition table khi bắt đầu ván mới
-            global transposition_table
-            transposition_table = {}
-            print("Bắt đầu ván mới - Đã reset transposition table")
-        
-        # Update global variables
-        global PLAYER_PIECE, AI_PIECE
-        AI_PIECE = game_state.current_player
-        PLAYER_PIECE = 3 - AI_PIECE
+            if game_id is None:
+                game_id = uuid.uuid4().hex
+            print(f"Bắt đầu ván mới: {game_id}")
         
-        # Manage transposition table
-        manage_transposition_table()
+        # The AI plays the side to move, scores are from its point of view
+        ai_piece = game_state.current_player
         
         # Verify valid moves
         verified_valid_moves = [col for col in valid_moves if get_next_open_row(board, col) != -1]
@@ -361,8 +324,19 @@ async def make_move(game_state: GameState) -> AIResponse:
         if not verified_valid_moves:
             raise ValueError("Không có nước đi hợp lệ sau khi xác minh")
         
-        # Use minimax algorithm to select the best move
-        selected_col, minimax_score = minimax(board, 5, -math.inf, math.inf, True)
+        # Use iterative deepening negamax within the time budget
+        time_budget = SEARCH_TIME_BUDGET if game_state.time_budget is None else game_state.time_budget
+        time_budget = min(time_budget, MAX_TIME_BUDGET)
+        if game_state.parallel and parallel_searcher is not None:
+            selected_col, minimax_score, depth, solved, line = await run_parallel_search(
+                position, ai_piece, time_budget)
+        else:
+            selected_col, minimax_score, depth, solved, line = await run_search(
+                position, ai_piece, time_budget, game_id, game_state.is_new_game)
+        print(f"Độ sâu tìm kiếm: {depth}, điểm: {minimax_score}, biến chính: {line}")
+        if solved is not None:
+            result, plies = solved
+            print(f"Giải chính xác: {result} sau {plies} nước")
         
         # Fallback to random move if needed
         if selected_col is None or selected_col not in verified_valid_moves:
@@ -378,34 +352,51 @@ async def make_move(game_state: GameState) -> AIResponse:
             else:
                 raise ValueError("Không còn nước đi hợp lệ")
         
-        board = drop_piece(board, row, selected_col, AI_PIECE)
+        board = drop_piece(board, row, selected_col, ai_piece)
         
         # Print the board state
         print_board(board, (row, selected_col))
         
         # Kiểm tra xem game đã kết thúc chưa
-        if winning_move(board, AI_PIECE):
+        if winning_move(board, ai_piece):
             print("AI thắng!")
         elif len(get_valid_moves(board)) == 0:
             print("Ván cờ hòa!")
         
-        return AIResponse(move=selected_col)
+        return AIResponse(move=selected_col, game_id=game_id)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Lỗi: {str(e)}")
         # Fallback strategy if an error occurs
-        if game_state.valid_moves:
-            col = game_state.valid_moves[0]
-            row = get_next_open_row(game_state.board, col)
+        if valid_moves:
+            col = valid_moves[0]
+            row = get_next_open_row(board, col)
             if row != -1:
-                return AIResponse(move=col)
+                return AIResponse(move=col, game_id=game_state.game_id)
             
-            for col in game_state.valid_moves:
-                row = get_next_open_row(game_state.board, col)
+            for col in valid_moves:
+                row = get_next_open_row(board, col)
                 if row != -1:
-                    return AIResponse(move=col)
+                    return AIResponse(move=col, game_id=game_state.game_id)
         
         raise HTTPException(status_code=400, detail=str(e))
     
+@app.post("/api/connect4-moves")
+async def make_moves(batch: BatchRequest) -> BatchResponse:
+    """Best moves of many positions at once, for tournaments and analysis."""
+    if not batch.positions:
+        return BatchResponse(results=[])
+    if len(batch.positions) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Tối đa {MAX_BATCH_SIZE} thế cờ mỗi lần")
+    time_budget = SEARCH_TIME_BUDGET if batch.time_budget is None else batch.time_budget
+    time_budget = min(time_budget, MAX_TIME_BUDGET)
+    positions = [(request_position(position), position.current_player) for position in batch.positions]
+    results = await run_batch(positions, time_budget, batch.max_depth)
+    return BatchResponse(results=[
+        BatchResult(move=col, score=score, depth=depth) for col, score, depth in results
+    ])
+
 @app.get("/api/test")
 async def health_check():
     return {"status": "ok", "message": "Server is running"}
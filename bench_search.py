@@ -0,0 +1,69 @@
+"""Node counts and timings of the search on a fixed set of positions.
+
+    python bench_search.py [depth] [positions] [workers]
+
+Every position is searched to a fixed depth with each move ordering, each
+from a fresh transposition table, and the totals are printed. With
+``workers`` the deterministic parallel search also runs with 1, 2, 4, ...
+up to ``workers`` processes and its speedup over one process is printed.
+"""
+import random
+import sys
+import time
+from search import Searcher, prepare_position, HISTORY_ORDERING, EVALUATION_ORDERING
+from parallel_search import ParallelSearcher
+
+
+def random_positions(count, seed=2024, max_moves=16):
+    """Reproducible positions reached by random play, none of them finished."""
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        position = prepare_position([[0] * 7 for _ in range(6)])
+        piece = 1
+        for _ in range(rng.randint(0, max_moves)):
+            position.make_move(rng.choice(position.get_valid_moves()), piece)
+            if position.is_win(piece):
+                position.undo_move()
+                break
+            piece = 3 - piece
+        positions.append((position, piece))
+    return positions
+
+
+def run(ordering, depth, positions):
+    nodes = 0
+    start = time.perf_counter()
+    for position, piece in positions:
+        searcher = Searcher(piece, ordering=ordering)
+        searcher.search(position, depth)
+        nodes += searcher.nodes
+    return nodes, time.perf_counter() - start
+
+
+def run_parallel(workers, depth, positions):
+    searcher = ParallelSearcher(workers, deterministic=True)
+    start = time.perf_counter()
+    for position, piece in positions:
+        if position.get_valid_moves():
+            searcher.search(position, piece, depth)
+    seconds = time.perf_counter() - start
+    searcher.close()
+    return searcher.nodes, seconds
+
+
+if __name__ == "__main__":
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    positions = random_positions(count)
+    print(f"depth {depth}, {count} positions")
+    for ordering in (EVALUATION_ORDERING, HISTORY_ORDERING):
+        nodes, seconds = run(ordering, depth, positions)
+        print(f"{ordering:>10}: {nodes:>9} nodes  {seconds:7.2f} s  {nodes / seconds:9.0f} nodes/s")
+    workers, base = 1, None
+    while workers <= max_workers:
+        nodes, seconds = run_parallel(workers, depth, positions)
+        base = base or seconds
+        print(f"{workers:>3} workers: {nodes:>9} nodes  {seconds:7.2f} s  speedup {base / seconds:5.2f}x")
+        workers *= 2
@@ -0,0 +1,248 @@
+"""Bitboard representation of a Connect 4 position.
+
+Each piece owns one integer bitmask. Bit ``col * H1 + h`` is set when that
+piece occupies column ``col`` at height ``h`` (0 = bottom row). Every column
+keeps one spare bit above the top row so shifted win checks never wrap into
+the next column.
+
+Positions also carry a 64-bit Zobrist hash, updated with one XOR per move,
+which is what the transposition table and other caches are keyed on. The
+hash of the mirrored board is maintained alongside it so caches can store a
+position and its mirror image under one key. The random keys come from a
+fixed seed so hashes are the same in every process and can be stored on
+disk.
+"""
+import random
+
+ROW_COUNT = 6
+COLUMN_COUNT = 7
+EMPTY = 0
+
+H1 = ROW_COUNT + 1
+
+BOTTOM_MASK = sum(1 << (col * H1) for col in range(COLUMN_COUNT))
+BOARD_MASK = BOTTOM_MASK * ((1 << ROW_COUNT) - 1)
+COLUMN_MASKS = [((1 << ROW_COUNT) - 1) << (col * H1) for col in range(COLUMN_COUNT)]
+
+_zobrist_random = random.Random(0xC0FFEE4)
+# ZOBRIST[piece][col][height], slot 0 unused
+ZOBRIST = [
+    [[_zobrist_random.getrandbits(64) for _ in range(ROW_COUNT)] for _ in range(COLUMN_COUNT)]
+    for _ in range(3)
+]
+
+
+def has_four(bitboard):
+    """Return True if the bitmask contains four aligned discs."""
+    # vertical, horizontal, "\" diagonal, "/" diagonal
+    for shift in (1, H1, H1 - 1, H1 + 1):
+        pairs = bitboard & (bitboard >> shift)
+        if pairs & (pairs >> (2 * shift)):
+            return True
+    return False
+
+
+def winning_cells(bitboard, occupied):
+    """Mask of the empty cells that would give ``bitboard`` four in a row."""
+    # vertical: three discs right below
+    cells = (bitboard << 1) & (bitboard << 2) & (bitboard << 3)
+    # horizontal and both diagonals: the missing disc can be at either end
+    # or in one of the two middle slots
+    for shift in (H1, H1 - 1, H1 + 1):
+        pair = (bitboard << shift) & (bitboard << 2 * shift)
+        cells |= pair & (bitboard << 3 * shift)
+        cells |= pair & (bitboard >> shift)
+        pair = (bitboard >> shift) & (bitboard >> 2 * shift)
+        cells |= pair & (bitboard << shift)
+        cells |= pair & (bitboard >> 3 * shift)
+    return cells & (BOARD_MASK ^ occupied)
+
+
+def mask_column(mask):
+    """Column of the lowest set bit of a non-empty mask."""
+    return ((mask & -mask).bit_length() - 1) // H1
+
+
+def mask_columns(mask):
+    return [col for col in range(COLUMN_COUNT) if mask & COLUMN_MASKS[col]]
+
+
+def mirror_column(col):
+    return COLUMN_COUNT - 1 - col
+
+
+def cell_bit(row, col):
+    """Bit for grid cell (row, col), row 0 being the top row as in the lists."""
+    return 1 << (col * H1 + ROW_COUNT - 1 - row)
+
+
+class Position:
+    def __init__(self, board=None):
+        self.bitboards = [0, 0, 0]  # indexed by piece, slot 0 unused
+        self.heights = [0] * COLUMN_COUNT
+        self.grid = [[EMPTY] * COLUMN_COUNT for _ in range(ROW_COUNT)]
+        self.moves = []
+        self.hash = 0  # Zobrist hash of the discs on the board
+        self.mirror_hash = 0  # hash of the left-right mirrored board
+        self.evaluator = None  # optional IncrementalEvaluator kept in sync
+        if board is not None:
+            for col in range(COLUMN_COUNT):
+                for row in range(ROW_COUNT - 1, -1, -1):
+                    piece = int(board[row][col])
+                    if piece == EMPTY:
+                        break
+                    self.make_move(col, piece)
+
+    def can_play(self, col):
+        return self.heights[col] < ROW_COUNT
+
+    def get_valid_moves(self):
+        return [col for col in range(COLUMN_COUNT) if self.heights[col] < ROW_COUNT]
+
+    def get_next_open_row(self, col):
+        if self.heights[col] >= ROW_COUNT:
+            return -1
+        return ROW_COUNT - 1 - self.heights[col]
+
+    def make_move(self, col, piece):
+        """Drop ``piece`` into ``col`` in place and return the row it landed on."""
+        height = self.heights[col]
+        row = ROW_COUNT - 1 - height
+        self.bitboards[piece] |= 1 << (col * H1 + height)
+        self.heights[col] = height + 1
+        self.hash ^= ZOBRIST[piece][col][height]
+        self.mirror_hash ^= ZOBRIST[piece][COLUMN_COUNT - 1 - col][height]
+        self.grid[row][col] = piece
+        self.moves.append((col, piece))
+        if self.evaluator is not None:
+            self.evaluator.update(row, col, piece)
+        return row
+
+    def undo_move(self):
+        """Take back the last move made with ``make_move``."""
+        col, piece = self.moves.pop()
+        if self.evaluator is not None:
+            self.evaluator.revert()
+        height = self.heights[col] - 1
+        self.heights[col] = height
+        self.bitboards[piece] ^= 1 << (col * H1 + height)
+        self.hash ^= ZOBRIST[piece][col][height]
+        self.mirror_hash ^= ZOBRIST[piece][COLUMN_COUNT - 1 - col][height]
+        self.grid[ROW_COUNT - 1 - height][col] = EMPTY
+        return col
+
+    def is_win(self, piece):
+        return has_four(self.bitboards[piece])
+
+    def is_full(self):
+        return len(self.moves) == ROW_COUNT * COLUMN_COUNT
+
+    def occupied(self):
+        return self.bitboards[1] | self.bitboards[2]
+
+    def playable_cells(self):
+        """Mask of the cell each non-full column would be played on."""
+        return (self.occupied() + BOTTOM_MASK) & BOARD_MASK
+
+    def winning_moves(self, piece):
+        """Mask of the cells where ``piece`` wins by playing now."""
+        return winning_cells(self.bitboards[piece], self.occupied()) & self.playable_cells()
+
+    def key(self):
+        """Exact integer key of the position (use ``hash`` for caches)."""
+        return self.bitboards[1] | (self.bitboards[2] << (COLUMN_COUNT * H1))
+
+    def canonical_hash(self):
+        """Hash shared by the position and its mirror image.
+
+        Returns (hash, mirrored); when ``mirrored`` is True the hash is the
+        one of the mirrored board and columns stored with it must go
+        through ``mirror_column``.
+        """
+        if self.mirror_hash < self.hash:
+            return self.mirror_hash, True
+        return self.hash, False
+
+    def to_board(self):
+        return [row[:] for row in self.grid]
+
+    def to_string(self):
+        """42 characters, row by row from the top, as read by ``position_from_string``."""
+        return "".join(str(piece) for row in self.grid for piece in row)
+
+
+# Compact encodings of a position for the wire, decoded straight into a
+# Position without building the nested list board. All raise ValueError
+# on malformed input.
+
+def position_from_string(text):
+    """Position from 42 characters ``0``/``1``/``2`` (``.`` for empty), row
+    by row from the top like the list board."""
+    if len(text) != ROW_COUNT * COLUMN_COUNT:
+        raise ValueError(f"board string must have {ROW_COUNT * COLUMN_COUNT} characters")
+    position = Position()
+    for col in range(COLUMN_COUNT):
+        # Column from the bottom up, nothing may float above an empty cell
+        discs = text[col::COLUMN_COUNT][::-1].rstrip("0.")
+        for char in discs:
+            if char in "0.":
+                raise ValueError(f"floating disc in column {col + 1}")
+            if char not in "12":
+                raise ValueError(f"invalid cell {char!r}")
+            position.make_move(col, int(char))
+    return position
+
+
+def position_from_board(board):
+    """Position from the list board: 6 rows of 7 cells 0/1/2, top row first."""
+    if len(board) != ROW_COUNT or any(len(row) != COLUMN_COUNT for row in board):
+        raise ValueError(f"board must have {ROW_COUNT} rows of {COLUMN_COUNT} cells")
+    position = Position()
+    for col in range(COLUMN_COUNT):
+        column = [board[row][col] for row in range(ROW_COUNT - 1, -1, -1)]
+        while column and column[-1] == EMPTY:
+            column.pop()
+        for piece in column:
+            if piece == EMPTY:
+                raise ValueError(f"floating disc in column {col + 1}")
+            if piece not in (1, 2):
+                raise ValueError(f"invalid cell {piece!r}")
+            position.make_move(col, piece)
+    return position
+
+
+def position_from_moves(moves, first_piece=1):
+    """Position after a move sequence such as ``"4453"``: 1-based columns,
+    players alternating from ``first_piece``."""
+    position = Position()
+    piece = first_piece
+    for char in moves:
+        if char < "1" or char > str(COLUMN_COUNT):
+            raise ValueError(f"invalid column {char!r}")
+        col = int(char) - 1
+        if not position.can_play(col):
+            raise ValueError(f"column {char} is full")
+        position.make_move(col, piece)
+        piece = 3 - piece
+    return position
+
+
+def position_from_key(key):
+    """Inverse of ``Position.key``: piece 1's bitboard in the low 49 bits,
+    piece 2's above them."""
+    bitboards = [0, key & ((1 << (COLUMN_COUNT * H1)) - 1), key >> (COLUMN_COUNT * H1)]
+    if key < 0 or bitboards[1] & bitboards[2] or (bitboards[1] | bitboards[2]) & ~BOARD_MASK:
+        raise ValueError("invalid packed position")
+    position = Position()
+    for col in range(COLUMN_COUNT):
+        for height in range(ROW_COUNT):
+            bit = 1 << (col * H1 + height)
+            if bitboards[1] & bit:
+                position.make_move(col, 1)
+            elif bitboards[2] & bit:
+                position.make_move(col, 2)
+            else:
+                break
+    if position.bitboards != bitboards:
+        raise ValueError("invalid packed position: floating disc")
+    return position
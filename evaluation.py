@@ -0,0 +1,284 @@
+"""Position evaluation shared by the app, the minimax module and the game.
+
+``score_position`` scores a list or ndarray board using the window tables
+of ``windows.py`` and ``score_positions`` does the same for a whole stack of
+boards with array operations. ``IncrementalEvaluator`` keeps the piece counts of every
+window together with the running score of both pieces, and only rescores
+what a dropped disc can change: the windows containing that cell, the horizontal
+windows right above it (their "playable" check looks at the cell below) and
+the threat scan of the columns whose open cell lines up with it. Scores are
+identical to ``score_position(board, piece)`` for the same board.
+"""
+import numpy as np
+from bitboard import ROW_COUNT, COLUMN_COUNT, EMPTY
+from windows import (WINDOWS, IS_HORIZONTAL, CELL_WINDOWS, PLAYABLE_WINDOWS,
+                     THREAT_WINDOWS, THREAT_DEPENDENTS)
+
+CENTER_COLUMN = COLUMN_COUNT // 2
+
+
+def _window_points(own, opp, empty, playable):
+    score = 0
+    if own == 4:
+        score += 100000
+    elif own == 3 and empty == 1:
+        if playable:
+            score += 100
+    elif own == 2 and empty == 2:
+        score += 10
+
+    if opp == 4:
+        score -= 100000
+    elif opp == 3 and empty == 1:
+        if playable:
+            score -= 80
+    elif opp == 2 and empty == 2:
+        score -= 5
+    return score
+
+
+# WINDOW_POINTS[playable][count of piece 1][count of piece 2] -> (score for 1, score for 2)
+WINDOW_POINTS = [
+    [
+        [
+            (_window_points(n1, n2, 4 - n1 - n2, playable), _window_points(n2, n1, 4 - n1 - n2, playable))
+            if n1 + n2 <= 4 else None
+            for n2 in range(5)
+        ]
+        for n1 in range(5)
+    ]
+    for playable in (False, True)
+]
+
+
+def _threat_points(threats, weight):
+    return weight * threats if threats > 1 else 0
+
+
+def is_playable(grid, cells):
+    """True if the empty cell of the window can be played right away."""
+    for r, c in cells:
+        if grid[r][c] == EMPTY:
+            return r == ROW_COUNT - 1 or grid[r + 1][c] != EMPTY
+    return True
+
+
+def column_threats(grid, r, c):
+    """Score (for piece 1, for piece 2) of the threat scan on open cell (r, c)."""
+    threats = [0, 0, 0]
+    for cells in THREAT_WINDOWS[r][c]:
+        values = [grid[tr][tc] for tr, tc in cells]
+        if values.count(EMPTY) == 1:
+            if values.count(1) == 2:
+                threats[1] += 1
+            elif values.count(2) == 2:
+                threats[2] += 1
+    return (
+        _threat_points(threats[1], 100) - _threat_points(threats[2], 120),
+        _threat_points(threats[2], 100) - _threat_points(threats[1], 120),
+    )
+
+
+def score_position(board, piece):
+    grid = board.tolist() if isinstance(board, np.ndarray) else board
+    side = piece - 1
+    score = 0
+
+    # Score every window
+    for w, cells in enumerate(WINDOWS):
+        values = [grid[r][c] for r, c in cells]
+        empty = values.count(EMPTY)
+        playable = True
+        if IS_HORIZONTAL[w] and empty == 1:
+            playable = is_playable(grid, cells)
+        score += WINDOW_POINTS[playable][values.count(1)][values.count(2)][side]
+
+    for c in range(COLUMN_COUNT):
+        open_row = -1
+        for r in range(ROW_COUNT - 1, -1, -1):
+            if grid[r][c] == piece:
+                # Center column and height bonus
+                score += (r + 1) * 0.5 + (3 if c == CENTER_COLUMN else 0)
+            elif grid[r][c] == EMPTY and open_row == -1:
+                open_row = r
+        # Multi-directional threats on the next open cell
+        if open_row != -1:
+            score += column_threats(grid, open_row, c)[side]
+
+    return score
+
+
+# Array versions of the tables above for score_positions
+_WINDOW_ROWS = np.array([[r for r, _ in cells] for cells in WINDOWS])
+_WINDOW_COLS = np.array([[c for _, c in cells] for cells in WINDOWS])
+_HORIZONTAL = np.array(IS_HORIZONTAL)
+_POINTS = np.array([
+    [[points if points is not None else (0, 0) for points in row] for row in table]
+    for table in WINDOW_POINTS
+])  # shape (2, 5, 5, 2)
+_CELL_POINTS = np.array([
+    [(r + 1) * 0.5 + (3 if c == CENTER_COLUMN else 0) for c in range(COLUMN_COUNT)]
+    for r in range(ROW_COUNT)
+])
+
+
+def _threat_arrays():
+    # THREAT_WINDOWS padded to three windows per cell; missing windows are
+    # pointed at cell (0, 0) and masked out with `valid`
+    rows = np.zeros((ROW_COUNT, COLUMN_COUNT, 3, 3), dtype=int)
+    cols = np.zeros((ROW_COUNT, COLUMN_COUNT, 3, 3), dtype=int)
+    valid = np.zeros((ROW_COUNT, COLUMN_COUNT, 3), dtype=bool)
+    for r in range(ROW_COUNT):
+        for c in range(COLUMN_COUNT):
+            for i, cells in enumerate(THREAT_WINDOWS[r][c]):
+                rows[r, c, i] = [tr for tr, _ in cells]
+                cols[r, c, i] = [tc for _, tc in cells]
+                valid[r, c, i] = True
+    return rows, cols, valid
+
+
+_THREAT_ROWS, _THREAT_COLS, _THREAT_VALID = _threat_arrays()
+
+
+def score_positions(boards, piece):
+    """Vectorised ``score_position`` for an (N, 6, 7) stack of boards.
+
+    Returns an array of N scores, equal to calling ``score_position`` on
+    every board.
+    """
+    boards = np.asarray(boards)
+    if boards.ndim == 2:
+        boards = boards[np.newaxis]
+    n = len(boards)
+    side = piece - 1
+
+    # Windows: counts per piece and the "playable" check of horizontal
+    # windows, looking at the cell under each window cell (the bottom row
+    # counts as supported)
+    values = boards[:, _WINDOW_ROWS, _WINDOW_COLS]
+    empty = values == EMPTY
+    n_empty = empty.sum(axis=2)
+    ones = (values == 1).sum(axis=2)
+    twos = (values == 2).sum(axis=2)
+    supported = np.ones((n, ROW_COUNT + 1, COLUMN_COUNT), dtype=bool)
+    supported[:, :ROW_COUNT] = boards != EMPTY
+    below = supported[:, _WINDOW_ROWS + 1, _WINDOW_COLS]
+    playable = ~_HORIZONTAL | (n_empty != 1) | (empty & below).any(axis=2)
+    scores = _POINTS[playable.astype(int), ones, twos, side].sum(axis=1)
+
+    # Center column and height bonus
+    scores = scores + ((boards == piece) * _CELL_POINTS).sum(axis=(1, 2))
+
+    # Threat scan on the next open cell of every column (first empty cell
+    # from the bottom)
+    column_empty = boards == EMPTY
+    has_open = column_empty.any(axis=1)
+    open_rows = ROW_COUNT - 1 - np.argmax(column_empty[:, ::-1, :], axis=1)
+    columns = np.arange(COLUMN_COUNT)
+    rows = _THREAT_ROWS[open_rows, columns]
+    cols = _THREAT_COLS[open_rows, columns]
+    valid = _THREAT_VALID[open_rows, columns] & has_open[:, :, np.newaxis]
+    cells = boards[np.arange(n)[:, np.newaxis, np.newaxis, np.newaxis], rows, cols]
+    one_empty = valid & ((cells == EMPTY).sum(axis=3) == 1)
+    own = (one_empty & ((cells == piece).sum(axis=3) == 2)).sum(axis=2)
+    opp = (one_empty & ((cells == 3 - piece).sum(axis=3) == 2)).sum(axis=2)
+    scores = scores + (np.where(own > 1, 100 * own, 0) - np.where(opp > 1, 120 * opp, 0)).sum(axis=1)
+
+    return scores
+
+
+class IncrementalEvaluator:
+    def __init__(self, position):
+        self.position = position
+        self.counts = [[0, 0, 0] for _ in WINDOWS]
+        self.window_scores = [(0, 0)] * len(WINDOWS)
+        self.threats = [(0, 0)] * COLUMN_COUNT
+        self.totals = [0, 0, 0]  # running score indexed by piece
+        self.history = []
+
+        grid = position.grid
+        for w, cells in enumerate(WINDOWS):
+            for r, c in cells:
+                self.counts[w][grid[r][c]] += 1
+        for w in range(len(WINDOWS)):
+            self._rescore_window(w)
+        for c in range(COLUMN_COUNT):
+            self._rescore_column(c)
+        for r in range(ROW_COUNT):
+            for c in range(COLUMN_COUNT):
+                piece = grid[r][c]
+                if piece != EMPTY:
+                    self.totals[piece] += self._cell_points(r, c)
+        position.evaluator = self
+
+    def score(self, piece):
+        """Same value as ``score_position(position.grid, piece)``."""
+        return self.totals[piece]
+
+    @staticmethod
+    def _cell_points(r, c):
+        # center column bonus plus the height bonus of score_position
+        return (r + 1) * 0.5 + (3 if c == CENTER_COLUMN else 0)
+
+    def _rescore_window(self, w):
+        counts = self.counts[w]
+        playable = True
+        if IS_HORIZONTAL[w] and counts[EMPTY] == 1:
+            playable = is_playable(self.position.grid, WINDOWS[w])
+        old = self.window_scores[w]
+        new = WINDOW_POINTS[playable][counts[1]][counts[2]]
+        self.window_scores[w] = new
+        self.totals[1] += new[0] - old[0]
+        self.totals[2] += new[1] - old[1]
+        return old
+
+    def _rescore_column(self, c):
+        old = self.threats[c]
+        r = self.position.get_next_open_row(c)
+        new = (0, 0) if r == -1 else column_threats(self.position.grid, r, c)
+        self.threats[c] = new
+        self.totals[1] += new[0] - old[0]
+        self.totals[2] += new[1] - old[1]
+        return old
+
+    def update(self, row, col, piece):
+        """Account for ``piece`` having just been dropped on (row, col)."""
+        saved_windows = []
+        saved_columns = []
+        for w in CELL_WINDOWS[row][col]:
+            counts = self.counts[w]
+            counts[EMPTY] -= 1
+            counts[piece] += 1
+            saved_windows.append((w, self._rescore_window(w)))
+        if row > 0:
+            for w in PLAYABLE_WINDOWS[row][col]:
+                saved_windows.append((w, self._rescore_window(w)))
+
+        saved_columns.append((col, self._rescore_column(col)))
+        heights = self.position.heights
+        for r, c in THREAT_DEPENDENTS[row][col]:
+            if c != col and heights[c] == ROW_COUNT - 1 - r:
+                saved_columns.append((c, self._rescore_column(c)))
+
+        cell_points = self._cell_points(row, col)
+        self.totals[piece] += cell_points
+        self.history.append((row, col, piece, cell_points, saved_windows, saved_columns))
+
+    def revert(self):
+        """Undo the bookkeeping of the last ``update``."""
+        row, col, piece, cell_points, saved_windows, saved_columns = self.history.pop()
+        self.totals[piece] -= cell_points
+        for c, old in reversed(saved_columns):
+            new = self.threats[c]
+            self.threats[c] = old
+            self.totals[1] += old[0] - new[0]
+            self.totals[2] += old[1] - new[1]
+        for w, old in reversed(saved_windows):
+            new = self.window_scores[w]
+            self.window_scores[w] = old
+            self.totals[1] += old[0] - new[0]
+            self.totals[2] += old[1] - new[1]
+        for w in CELL_WINDOWS[row][col]:
+            counts = self.counts[w]
+            counts[piece] -= 1
+            counts[EMPTY] += 1
@@ -0,0 +1,204 @@
+"""Append-only on-disk store of played transitions.
+
+    python experience_store.py [pickle] [directory]
+
+imports a pickled list of transitions (default ``data/experience.pkl``) into
+a store (default ``data/experience``).
+
+A transition is (board, action, next board, reward, done). The store is a
+directory of chunk files, each a header followed by fixed-size records, so
+chunks are read with memory maps: ``batches`` streams the records without
+loading a whole chunk, and ``sample`` draws random transitions from all of
+them. New records go to the last chunk until it reaches ``chunk_size``
+bytes; with ``max_chunks`` the oldest chunks are deleted beyond that count.
+
+Boards (rows of 0/1/2, top row first, discs stacked from the bottom) are
+packed into 64 bits column by column, ``rows + 1`` bits per column: a bit
+for every disc of piece 1 and a marker bit above the top disc.
+"""
+import os
+import pickle
+import struct
+import sys
+import numpy as np
+
+MAGIC = b"C4XP"
+VERSION = 1
+HEADER = struct.Struct("<4sIII")  # magic, version, board rows, board columns
+RECORD = np.dtype({
+    "names": ["state", "next_state", "reward", "action", "done"],
+    "formats": ["<u8", "<u8", "<f4", "u1", "u1"],
+    "offsets": [0, 8, 16, 20, 21],
+    "itemsize": 24,
+})
+
+DEFAULT_PATH = "data/experience"
+PICKLE_PATH = "data/experience.pkl"
+DEFAULT_CHUNK_SIZE = 64 << 20
+BATCH_SIZE = 1 << 16
+
+
+def pack_boards(boards):
+    """uint64 keys of an array of boards, shape (count, rows, columns)."""
+    boards = np.asarray(boards)
+    count, rows, columns = boards.shape
+    if (rows + 1) * columns > 64:
+        raise ValueError(f"{rows}x{columns} boards do not fit 64 bits")
+    bottom_up = boards[:, ::-1, :]
+    heights = (bottom_up != 0).sum(axis=1)
+    if ((bottom_up != 0) != (np.arange(rows)[None, :, None] < heights[:, None, :])).any():
+        raise ValueError("floating disc")
+    shifts = np.arange(columns, dtype=np.uint64) * np.uint64(rows + 1)
+    cells = np.left_shift(np.uint64(1), np.arange(rows, dtype=np.uint64)[:, None] + shifts)
+    keys = (np.where(bottom_up == 1, cells, np.uint64(0))).sum(axis=(1, 2), dtype=np.uint64)
+    markers = np.left_shift(np.uint64(1), heights.astype(np.uint64) + shifts)
+    return keys + markers.sum(axis=1, dtype=np.uint64)
+
+
+def unpack_boards(keys, rows, columns):
+    """Boards of an array of keys, shape (count, rows, columns)."""
+    keys = np.asarray(keys, dtype=np.uint64)
+    boards = np.zeros((len(keys), rows, columns), dtype=np.int8)
+    for col in range(columns):
+        bits = (keys >> np.uint64(col * (rows + 1))) & np.uint64((1 << (rows + 1)) - 1)
+        height = np.zeros(len(keys), dtype=np.int64)
+        for row in range(1, rows + 1):
+            height[(bits >> np.uint64(row)) != 0] = row
+        for row in range(rows):
+            piece = np.where((bits >> np.uint64(row)) & np.uint64(1), 1, 2)
+            boards[:, rows - 1 - row, col] = np.where(row < height, piece, 0)
+    return boards
+
+
+class ExperienceStore:
+    def __init__(self, path=DEFAULT_PATH, rows=6, columns=7, chunk_size=DEFAULT_CHUNK_SIZE,
+                 max_chunks=None):
+        self.path = path
+        self.rows = rows
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.file = None
+        os.makedirs(path, exist_ok=True)
+        for chunk in self.chunks():
+            self._check(chunk)
+
+    def chunks(self):
+        """Paths of the chunk files, oldest first."""
+        names = sorted(name for name in os.listdir(self.path) if name.endswith(".bin"))
+        return [os.path.join(self.path, name) for name in names]
+
+    def _check(self, chunk):
+        with open(chunk, "rb") as f:
+            magic, version, rows, columns = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{chunk} is not an experience chunk (version {VERSION})")
+        if (rows, columns) != (self.rows, self.columns):
+            raise ValueError(f"{chunk} holds {rows}x{columns} boards")
+
+    def _writer(self):
+        """File to append to, starting a new chunk when the last one is full."""
+        if self.file is not None and self.file.tell() < self.chunk_size:
+            return self.file
+        self.close()
+        chunks = self.chunks()
+        if chunks and os.path.getsize(chunks[-1]) < self.chunk_size:
+            self.file = open(chunks[-1], "ab")
+            return self.file
+        number = int(os.path.basename(chunks[-1])[:-4]) + 1 if chunks else 0
+        self.file = open(os.path.join(self.path, f"{number:06d}.bin"), "ab")
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.rows, self.columns))
+        if self.max_chunks is not None:
+            for chunk in chunks[:max(len(chunks) + 1 - self.max_chunks, 0)]:
+                os.remove(chunk)
+        return self.file
+
+    def extend(self, boards, actions, next_boards, rewards, dones):
+        """Append many transitions given as arrays."""
+        records = np.zeros(len(actions), dtype=RECORD)
+        records["state"] = pack_boards(boards)
+        records["next_state"] = pack_boards(next_boards)
+        records["reward"] = rewards
+        records["action"] = actions
+        records["done"] = dones
+        start = 0
+        while start < len(records):
+            f = self._writer()
+            # Whole records up to the chunk size, at least one
+            count = max(1, (self.chunk_size - f.tell()) // RECORD.itemsize)
+            f.write(records[start:start + count].tobytes())
+            start += count
+
+    def append(self, board, action, next_board, reward, done):
+        self.extend([board], [action], [next_board], [reward], [done])
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _records(self, chunk):
+        count = (os.path.getsize(chunk) - HEADER.size) // RECORD.itemsize
+        if count <= 0:
+            return np.zeros(0, dtype=RECORD)
+        return np.memmap(chunk, dtype=RECORD, mode="r", offset=HEADER.size, shape=count)
+
+    def decode(self, records):
+        """(boards, actions, next boards, rewards, dones) of a record array."""
+        return (unpack_boards(records["state"], self.rows, self.columns),
+                np.array(records["action"]),
+                unpack_boards(records["next_state"], self.rows, self.columns),
+                np.array(records["reward"]),
+                np.array(records["done"], dtype=bool))
+
+    def batches(self, size=BATCH_SIZE):
+        """Stream every transition, oldest first, as decoded arrays of up
+        to ``size`` transitions."""
+        self.flush()
+        for chunk in self.chunks():
+            records = self._records(chunk)
+            for start in range(0, len(records), size):
+                yield self.decode(records[start:start + size])
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from zip(*(column.tolist() for column in batch))
+
+    def sample(self, count, rng=None):
+        """``count`` transitions drawn uniformly with replacement, as decoded arrays."""
+        self.flush()
+        rng = np.random.default_rng(rng)
+        chunks = [self._records(chunk) for chunk in self.chunks()]
+        sizes = np.array([len(records) for records in chunks])
+        if not sizes.sum():
+            raise ValueError("the experience store is empty")
+        picks = np.sort(rng.integers(0, sizes.sum(), count))
+        starts = np.concatenate([[0], np.cumsum(sizes)])
+        owners = np.searchsorted(starts, picks, side="right") - 1
+        records = np.concatenate([
+            chunks[chunk][picks[owners == chunk] - starts[chunk]] for chunk in np.unique(owners)
+        ])
+        return self.decode(records[rng.permutation(count)])
+
+    def __len__(self):
+        self.flush()
+        return sum(len(self._records(chunk)) for chunk in self.chunks())
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else PICKLE_PATH
+    path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PATH
+    with open(source, "rb") as f:
+        transitions = list(pickle.load(f))
+    if not transitions:
+        sys.exit(f"{source} has no transitions")
+    boards, actions, next_boards, rewards, dones = zip(*transitions)
+    rows, columns = np.shape(boards[0])
+    store = ExperienceStore(path, rows, columns)
+    store.extend(boards, actions, next_boards, rewards, dones)
+    store.close()
+    print(f"{len(transitions)} transitions written to {path}, {len(store)} in the store")
@@ -0,0 +1,123 @@
+"""Opening book: best moves of the first plies, computed offline.
+
+    python opening_book.py [plies] [time_budget] [output]
+
+Builds the book by running the engine on every position where the AI is to
+move within the first ``plies`` plies (default 6), for both AI pieces and
+whether the AI starts or not. On its own turns only the AI's chosen move is
+followed, on the opponent's turns every reply. Each position gets
+``time_budget`` seconds (default 1.0) of iterative deepening.
+
+The file is a header followed by fixed-size records sorted by key, so
+``OpeningBook`` memory-maps it and finds a position with a binary search
+without reading the file into memory. Keys are the transposition table
+keys of ``Searcher.table_key``: the canonical Zobrist hash, so mirrored
+positions share a record, mixed with the AI piece.
+"""
+import mmap
+import struct
+import sys
+import time
+from bitboard import mirror_column
+from search import Searcher, prepare_position, PERSPECTIVE_KEYS
+from transposition import TranspositionTable
+
+MAGIC = b"C4BK"
+VERSION = 1
+HEADER = struct.Struct("<4sII")  # magic, version, record count
+RECORD = struct.Struct("<QfBBxx")  # key, score, column, depth
+
+DEFAULT_PLIES = 6
+DEFAULT_TIME_BUDGET = 1.0
+DEFAULT_PATH = "data/opening_book.bin"
+
+
+def book_key(position, ai_piece):
+    """Key of ``position`` with ``ai_piece`` to move and whether it is mirrored."""
+    key, mirrored = position.canonical_hash()
+    return key ^ PERSPECTIVE_KEYS[ai_piece][True], mirrored
+
+
+class OpeningBook:
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.data.close()
+            raise ValueError(f"{path} is not an opening book (version {VERSION})")
+
+    def probe(self, position, ai_piece):
+        """Return (column, score, depth) for ``ai_piece`` to move, or None."""
+        key, mirrored = book_key(position, ai_piece)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            record_key = RECORD.unpack_from(self.data, HEADER.size + middle * RECORD.size)[0]
+            if record_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.count:
+            return None
+        record_key, score, col, depth = RECORD.unpack_from(self.data, HEADER.size + low * RECORD.size)
+        if record_key != key:
+            return None
+        return (mirror_column(col) if mirrored else col), score, depth
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.data.close()
+
+
+def build(plies=DEFAULT_PLIES, time_budget=DEFAULT_TIME_BUDGET, log=print):
+    """Search every book position, returns {key: (column, score, depth)}."""
+    transposition_table = TranspositionTable()
+    entries = {}
+
+    def expand(position, piece, ai_piece):
+        if len(position.moves) >= plies or not position.get_valid_moves():
+            return
+        if piece == ai_piece:
+            key, mirrored = book_key(position, ai_piece)
+            if key not in entries:
+                searcher = Searcher(ai_piece, transposition_table)
+                col, score, depth = searcher.iterative_deepening(position, time_budget)
+                # Columns are stored for the canonical orientation
+                entries[key] = (mirror_column(col) if mirrored else col), score, depth
+                log(f"{len(entries):6d}  ply {len(position.moves)}  AI {ai_piece}  "
+                    f"move {col}  score {score}  depth {depth}")
+            col = entries[key][0]
+            replies = [mirror_column(col) if mirrored else col]
+        else:
+            replies = position.get_valid_moves()
+        for col in replies:
+            position.make_move(col, piece)
+            if not position.is_win(piece):
+                expand(position, 3 - piece, ai_piece)
+            position.undo_move()
+
+    for ai_piece in (1, 2):
+        for first_piece in (ai_piece, 3 - ai_piece):
+            expand(prepare_position([[0] * 7 for _ in range(6)]), first_piece, ai_piece)
+    return entries
+
+
+def save(entries, path=DEFAULT_PATH):
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        for key in sorted(entries):
+            col, score, depth = entries[key]
+            f.write(RECORD.pack(key, score, col, min(depth, 255)))
+
+
+if __name__ == "__main__":
+    plies = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PLIES
+    time_budget = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_TIME_BUDGET
+    path = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_PATH
+    start = time.perf_counter()
+    entries = build(plies, time_budget)
+    save(entries, path)
+    print(f"{len(entries)} positions written to {path} in {time.perf_counter() - start:.0f} s")
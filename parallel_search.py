@@ -0,0 +1,158 @@
+"""Root-splitting parallel search over several processes.
+
+The first root move is searched with the full window, then all the other
+root moves at once, one task per move, with a null window around its
+score; only the moves that turn out better are searched again with the
+full window, also in parallel. Every worker process keeps its own
+transposition table between tasks, so the previous iteration's results
+speed up the next one.
+
+With ``deterministic=True`` every task searches from a fresh table and the
+root moves are ordered by evaluation, so the result of a fixed-depth
+search does not depend on the number of workers or on timing.
+"""
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from search import (Searcher, SearchTimeout, prepare_position, NULL_WINDOW, LOSS_SCORE,
+                    SOLVER_EMPTY_CELLS)
+from transposition import TranspositionTable, DEFAULT_CAPACITY
+from bitboard import ROW_COUNT, COLUMN_COUNT
+
+# Table of every task in deterministic mode, small so that allocating it
+# for each task stays cheap
+DETERMINISTIC_CAPACITY = 1 << 16
+
+_table = None
+
+
+def _init_worker(capacity):
+    global _table
+    _table = TranspositionTable(capacity)
+
+
+def _search_move(position, ai_piece, col, depth, alpha, beta, deadline, deterministic):
+    """Score of root move ``col`` for the AI, None if ``deadline`` passed.
+
+    Returns (score, nodes).
+    """
+    table = TranspositionTable(DETERMINISTIC_CAPACITY) if deterministic else _table
+    searcher = Searcher(ai_piece, table)
+    searcher.deadline = deadline
+    position = prepare_position(position)
+    position.make_move(col, ai_piece)
+    try:
+        score = -searcher.negamax(position, depth - 1, -beta, -alpha, 3 - ai_piece)[1]
+    except SearchTimeout:
+        return None
+    return score, searcher.nodes
+
+
+class ParallelSearcher:
+    def __init__(self, workers=None, capacity=DEFAULT_CAPACITY, deterministic=False,
+                 solver=None, solver_empty_cells=SOLVER_EMPTY_CELLS, opening_book=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.deterministic = deterministic
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(capacity,))
+        # Root shortcuts (book, forced moves, endgame solver) run here
+        self.solver = solver
+        self.solver_empty_cells = solver_empty_cells
+        self.opening_book = opening_book
+        self.nodes = 0
+        self.solved = None
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def _run(self, tasks, position, ai_piece, depth, deadline):
+        """Run (col, alpha, beta) tasks in parallel, returns {col: score} or
+        None if the deadline passed."""
+        futures = {
+            col: self.pool.submit(_search_move, position, ai_piece, col, depth, alpha, beta,
+                                  deadline, self.deterministic)
+            for col, alpha, beta in tasks
+        }
+        wait(futures.values())
+        scores = {}
+        for col, future in futures.items():
+            result = future.result()
+            if result is None:
+                return None
+            scores[col], nodes = result
+            self.nodes += nodes
+        return scores
+
+    def search_root(self, position, ai_piece, depth, moves, deadline=None):
+        """One iteration at ``depth`` over the ordered root ``moves``.
+
+        Returns (column, score, {column: score or bound}) or None on timeout.
+        """
+        first = moves[0]
+        scores = self._run([(first, -math.inf, math.inf)], position, ai_piece, depth, deadline)
+        if scores is None:
+            return None
+        alpha = scores[first]
+
+        # Null window probes: can any other move beat the first one?
+        probes = self._run([(col, alpha, alpha + NULL_WINDOW) for col in moves[1:]],
+                           position, ai_piece, depth, deadline)
+        if probes is None:
+            return None
+        scores.update(probes)
+        better = [col for col in moves[1:] if probes[col] > alpha]
+        if better:
+            exact = self._run([(col, alpha, math.inf) for col in better],
+                              position, ai_piece, depth, deadline)
+            if exact is None:
+                return None
+            scores.update(exact)
+
+        # Ties go to the earlier move, as in the serial search, whose root
+        # order may differ
+        best = max(moves, key=lambda col: (scores[col], -moves.index(col)))
+        return best, scores[best], scores
+
+    def root_moves(self, position, ai_piece):
+        searcher = Searcher(ai_piece)
+        moves, _ = searcher.threat_moves(position, ai_piece)
+        return searcher.sort_valid_moves(position, moves, ai_piece)
+
+    def search(self, position, ai_piece, depth):
+        """Fixed-depth search for ``ai_piece`` to move, returns (column, score)."""
+        position = prepare_position(position)
+        col, score, _ = self.search_root(position, ai_piece, depth, self.root_moves(position, ai_piece))
+        return col, score
+
+    def iterative_deepening(self, position, ai_piece, time_budget, max_depth=None):
+        """Same contract as ``Searcher.iterative_deepening``, searched in parallel."""
+        position = prepare_position(position)
+        start = time.perf_counter()
+        searcher = Searcher(ai_piece, TranspositionTable(1), solver=self.solver,
+                            solver_empty_cells=self.solver_empty_cells,
+                            opening_book=self.opening_book)
+        result = searcher.root_result(position, start + time_budget)
+        self.solved = searcher.solved
+        if result is not None:
+            return result
+
+        empty_cells = ROW_COUNT * COLUMN_COUNT - len(position.moves)
+        if max_depth is None or max_depth > empty_cells:
+            max_depth = empty_cells
+
+        moves = self.root_moves(position, ai_piece)
+        best_col, best_score, completed = None, None, 0
+        for depth in range(1, max_depth + 1):
+            result = self.search_root(position, ai_piece, depth, moves,
+                                      start + time_budget if depth > 1 else None)
+            if result is None:
+                break
+            best_col, best_score, scores = result
+            completed = depth
+            # Best move first, the others by their score or bound
+            moves = sorted(moves, key=lambda col: (col != best_col, -scores[col]))
+            if abs(best_score) >= -LOSS_SCORE:
+                break
+            if time.perf_counter() - start >= time_budget:
+                break
+        return best_col, best_score, completed
@@ -1,7 +1,11 @@
+import os
 import numpy as np
+from functools import lru_cache
 from board import *
 from pandas import read_csv
 import ast
+from q_table import (QTable, QTableFile, DEFAULT_PATH as Q_TABLE_PATH, CSV_PATH, mirror_index,
+                     canonical_index, pack_index, pack_board)
 HEIGHT = 5
 WIDTH = 6
 # rewards
@@ -13,12 +17,30 @@ alpha=0.9 # learning rate
 gamma=0.95 # discount factor
 q_init=0.6 # init q table
 
+# one read-only mapping per process, shared by all agents
+@lru_cache(maxsize=None)
+def open_table_file(path):
+    return QTableFile(path)
+
 class PlayQlearning():
-    def __init__(self, player):
-        Q_table = {}
-        table = read_csv('q_learning_table.csv')
-        for i in range(len(table['states'])):
-            Q_table[table['states'][i]] = ast.literal_eval(table['scores'][i])
+    def __init__(self, player, table_path=Q_TABLE_PATH):
+        # states read or updated by this agent, keyed on packed boards
+        Q_table = QTable(WIDTH, q_init)
+        self.tableFile = None
+        if os.path.exists(table_path):
+            # binary table (q_table.py): states are read on first use
+            self.tableFile = open_table_file(table_path)
+        else:
+            table = read_csv(CSV_PATH, dtype={'states': str})
+            for i in range(len(table['states'])):
+                # a position and its mirror image share one entry
+                index, mirrored = self.canonicalIndex(table['states'][i])
+                value = np.array(ast.literal_eval(table['scores'][i]), dtype=float)
+                key = pack_index(index)
+                row = Q_table.find(key)
+                if row is None:
+                    row = Q_table.add(key)
+                Q_table.values[row] = value[::-1] if mirrored else value
         self.QTable = Q_table
         self.history = []
         self.player = 1
@@ -64,16 +86,51 @@ class PlayQlearning():
                 index += str(the_board[i][j])
         return index
 
-    def getQValue(self, board_index):
-        if board_index in self.QTable:
-            value = self.QTable[board_index]
-        else:
-            value = q_init*np.ones((WIDTH))
-            self.QTable[board_index] = value
-        return value
+    # mirror the index string left to right
+    def mirrorIndex(self, index):
+        return mirror_index(index, WIDTH)
+
+    # index shared by a board and its mirror image, and whether it is the mirror's
+    def canonicalIndex(self, board_index):
+        return canonical_index(board_index, WIDTH)
+
+    # packed key shared by a board and its mirror image, and whether it is the mirror's
+    def canonicalKey(self, the_board):
+        key, mirror = pack_board(the_board)
+        if mirror < key:
+            return mirror, True
+        return key, False
+
+    # board_key is a canonical packed key or, as in the dict table, a state
+    # string; a string is folded with its mirror like the boards of play, the
+    # Q-values of a mirrored one being a reversed view of the stored row
+    def getQValue(self, board_key):
+        if isinstance(board_key, str):
+            index, mirrored = self.canonicalIndex(board_key)
+            value = self.getQValue(pack_index(index))
+            return value[::-1] if mirrored else value
+        row = self.QTable.find(board_key)
+        if row is None:
+            value = None
+            if self.tableFile is not None:
+                row = self.tableFile.find(board_key)
+                if row is not None:
+                    value = self.tableFile.values[row]
+            # the agent's own copy, the file stays read-only
+            row = self.QTable.add(board_key, value)
+        return self.QTable.values[row]
     
+    # {state string: Q-values} of every known state, the arrays being views
+    # into the table (valid until the next state is added)
     def getQTable(self):
-        return self.QTable
+        if self.tableFile is not None:
+            for key in self.tableFile.keys.tolist():
+                self.getQValue(key)
+        return dict(self.QTable.items(HEIGHT*WIDTH))
+
+    # write every known state, read or not, to a binary table
+    def saveQTable(self, path=Q_TABLE_PATH):
+        self.QTable.save(path, HEIGHT*WIDTH, self.tableFile)
 
     def checkPosAvaliable(self, y, the_board):
         if y<0 or y>=WIDTH:
@@ -84,15 +141,18 @@ class PlayQlearning():
 
     def findBestMove(self, the_board):
         # get the max pos
-        boardIndex = self.indexBoard(the_board)
-        qValue = self.getQValue(boardIndex)
+        boardKey, mirrored = self.canonicalKey(the_board)
+        qValue = self.getQValue(boardKey)
+        if mirrored:
+            qValue = qValue[::-1] # view in board columns, writes go to the table
         while True:
             maxIndex = np.argmax(qValue) # get the max value index
             if self.checkPosAvaliable(maxIndex, the_board):
                 break
             else:
                 qValue[maxIndex] = -1.0
-        self.history.append((boardIndex, maxIndex))
+        # history is kept in the columns of the stored (canonical) board
+        self.history.append((boardKey, WIDTH-1-maxIndex if mirrored else maxIndex))
         return maxIndex
 
     def finalResult(self, winner):
@@ -0,0 +1,133 @@
+"""Self-play of many Q-learning games at once, as NumPy arrays.
+
+    python q_simulator.py [games] [epsilon]
+
+``simulate`` steps all games in lockstep: every ply packs the boards of the
+games still running into state keys with one product, looks their Q-values
+up in the tables of the pieces to move with one vectorized probe, picks
+epsilon-greedy moves among the legal columns, and checks wins on a bitboard
+of each game (bit ``col * (HEIGHT + 1) + height``, as in bitboard.py).
+Moves are chosen like ``PlayQlearning.findBestMove``: the legal column with
+the highest Q-value, Q-values of unknown states being ``q_init``; the tables
+are only read. The result lists every move of every game, in the canonical
+orientation that ``PlayQlearning`` keeps in its history.
+"""
+import sys
+import time
+from collections import namedtuple
+import numpy as np
+from q_learning import HEIGHT, WIDTH, q_init
+from q_train_parallel import CHECKPOINT_PATHS
+from q_table import QTableFile
+
+CELLS = HEIGHT * WIDTH
+H1 = HEIGHT + 1
+POWERS = 3 ** np.arange(CELLS - 1, -1, -1, dtype=np.uint64)
+# Shifts to the next cell of a line: vertical, horizontal and both diagonals
+DIRECTIONS = [np.uint64(shift) for shift in (1, H1, H1 + 1, H1 - 1)]
+
+TIED = 3
+
+# Moves of all games, in play order: game index, piece, canonical state key
+# and column, plus the winner of each game (1, 2 or TIED)
+Trajectories = namedtuple("Trajectories", "games pieces states actions winners")
+
+
+def wins(bitboards):
+    """Whether each bitboard holds four in a row."""
+    won = np.zeros(len(bitboards), dtype=bool)
+    for shift in DIRECTIONS:
+        pairs = bitboards & (bitboards >> shift)
+        won |= (pairs & (pairs >> (shift + shift))) != 0
+    return won
+
+
+def q_values(table, keys):
+    """Q-values of packed states in a QTable or QTableFile (None: q_init)."""
+    values = np.full((len(keys), WIDTH), q_init, dtype=np.float32)
+    if table is not None and len(keys):
+        rows = table.find_many(keys)
+        known = rows >= 0
+        values[known] = table.values[rows[known]]
+    return values
+
+
+def simulate(games, tables, epsilon=0.0, rng=None):
+    """Play ``games`` games between the Q-tables ``tables[1]`` and ``tables[2]``.
+
+    The first player of each game is random, and each move is random among
+    the legal columns with probability ``epsilon``. Returns Trajectories.
+    """
+    rng = np.random.default_rng(rng)
+    boards = np.zeros((games, HEIGHT, WIDTH), dtype=np.uint64)
+    heights = np.zeros((games, WIDTH), dtype=np.int64)
+    bitboards = np.zeros((games, 3), dtype=np.uint64)
+    to_move = rng.integers(1, 3, games)
+    winners = np.zeros(games, dtype=np.int8)
+    running = np.arange(games)
+    moves = []
+
+    for ply in range(CELLS):
+        if not running.size:
+            break
+        pieces = to_move[running]
+        flat = boards[running].reshape(len(running), CELLS)
+        keys = flat @ POWERS
+        mirrors = boards[running][:, :, ::-1].reshape(len(running), CELLS) @ POWERS
+        mirrored = mirrors < keys
+        keys = np.minimum(keys, mirrors)
+
+        values = np.empty((len(running), WIDTH), dtype=np.float32)
+        for piece in (1, 2):
+            side = pieces == piece
+            values[side] = q_values(tables.get(piece), keys[side])
+        values[mirrored] = values[mirrored, ::-1]
+        legal = heights[running] < HEIGHT
+        explore = rng.random(len(running)) < epsilon
+        values[explore] = rng.random((explore.sum(), WIDTH))
+        cols = np.where(legal, values, -np.inf).argmax(axis=1)
+        moves.append((running, pieces, keys, np.where(mirrored, WIDTH - 1 - cols, cols)))
+
+        # Drop the discs
+        rows = HEIGHT - 1 - heights[running, cols]
+        boards[running, rows, cols] = pieces
+        bits = np.left_shift(np.uint64(1), (cols * H1 + heights[running, cols]).astype(np.uint64))
+        bitboards[running, pieces] |= bits
+        heights[running, cols] += 1
+
+        won = wins(bitboards[running, pieces])
+        winners[running[won]] = pieces[won]
+        if ply == CELLS - 1:
+            winners[running[~won]] = TIED
+        to_move[running] = 3 - pieces
+        running = running[~won]
+
+    return Trajectories(*(np.concatenate(column) for column in zip(*moves)), winners)
+
+
+def episodes(trajectories):
+    """(history of piece 1, history of piece 2, winner) of every game, the
+    histories holding (state key, column) like ``PlayQlearning.history``."""
+    histories = [([], []) for _ in trajectories.winners]
+    for game, piece, state, action in zip(*(column.tolist() for column in trajectories[:4])):
+        histories[game][piece - 1].append((state, action))
+    return [(*history, winner) for history, winner in zip(histories, trajectories.winners.tolist())]
+
+
+if __name__ == "__main__":
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    epsilon = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    tables = {}
+    for piece, path in CHECKPOINT_PATHS.items():
+        try:
+            tables[piece] = QTableFile(path)
+        except FileNotFoundError:
+            pass
+    start = time.perf_counter()
+    trajectories = simulate(games, tables, epsilon)
+    seconds = time.perf_counter() - start
+    counts = np.bincount(trajectories.winners, minlength=TIED + 1)
+    print(f"{games} games, {len(trajectories.games)} moves in {seconds:.2f} s "
+          f"({games / seconds:.0f} games/s)")
+    print(f"piece 1 wins {counts[1] / games:.1%}, piece 2 wins {counts[2] / games:.1%}, "
+          f"tied {counts[TIED] / games:.1%}")
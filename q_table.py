@@ -0,0 +1,290 @@
+"""Binary Q-table files.
+
+    python q_table.py [csv] [output]
+
+converts a ``q_learning_table.csv`` (default) to the binary format (default
+``q_learning_table.bin``).
+
+The CSV keeps every state as a string and its Q-values as the text of a
+list, so loading it means parsing every row. The binary file is a header,
+the packed state keys sorted as uint64 and a float32 matrix of Q-values with
+one row per key, so ``QTableFile`` memory-maps it and finds a state with a
+binary search over the keys. The mapping is read-only: agents and processes
+opening the same file share its pages.
+
+A state string (one character 0/1/2 per cell, row by row) is packed by
+reading it as a base-3 number, which fits 64 bits for up to 40 cells. Rows
+are stored for the canonical state, the smaller of the string and its mirror.
+
+``QTable`` is the in-memory table of a learning agent: packed keys map to
+the rows of one growable float32 matrix through an open-addressing hash
+index held in NumPy arrays, so a state costs about 50 bytes instead of the
+hundreds of a dict of strings to arrays.
+"""
+import mmap
+import os
+import struct
+import sys
+import numpy as np
+from pandas import read_csv
+
+MAGIC = b"C4QT"
+VERSION = 1
+# magic, version, state count, cells, width; padded so the keys are aligned
+HEADER = struct.Struct("<4sIIII4x")
+
+MAX_CELLS = 40  # 3**40 < 2**64
+
+# QTable starts with this many rows and doubles when full, its hash index
+# keeps at least twice as many slots as rows
+DEFAULT_CAPACITY = 1024
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15  # Fibonacci hashing
+
+DEFAULT_PATH = "q_learning_table.bin"
+CSV_PATH = "q_learning_table.csv"
+
+
+def pack_index(index):
+    """uint64 key of a state string."""
+    return int(index, 3)
+
+
+def unpack_index(key, cells):
+    """State string of a packed key."""
+    return np.base_repr(key, 3).zfill(cells)
+
+
+def pack_board(board):
+    """Packed keys of a board (rows of 0/1/2) and of its mirror image."""
+    board = np.asarray(board, dtype=np.uint64)
+    powers = 3 ** np.arange(board.size - 1, -1, -1, dtype=np.uint64)
+    return int(board.ravel() @ powers), int(board[:, ::-1].ravel() @ powers)
+
+
+def mirror_index(index, width):
+    """State string of the board mirrored left to right."""
+    return "".join(index[i:i + width][::-1] for i in range(0, len(index), width))
+
+
+def canonical_index(index, width):
+    """Index shared by a board and its mirror image, and whether it is the mirror's."""
+    mirror = mirror_index(index, width)
+    if mirror < index:
+        return mirror, True
+    return index, False
+
+
+class QTableFile:
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self.cells, self.width = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.data.close()
+            raise ValueError(f"{path} is not a Q-table (version {VERSION})")
+        self.keys = np.frombuffer(self.data, dtype="<u8", count=self.count, offset=HEADER.size)
+        self.values = np.frombuffer(
+            self.data, dtype="<f4", count=self.count * self.width, offset=HEADER.size + 8 * self.count
+        ).reshape(self.count, self.width)
+
+    def find(self, key):
+        """Row of a packed key, or None."""
+        # searchsorted is only fast with a key of the array's dtype
+        row = int(self.keys.searchsorted(np.uint64(key)))
+        if row < self.count and self.keys[row] == key:
+            return row
+        return None
+
+    def find_many(self, keys):
+        """Rows of an array of packed keys, -1 for missing ones."""
+        keys = np.asarray(keys, dtype=np.uint64)
+        if not self.count:
+            return np.full(len(keys), -1)
+        rows = np.minimum(self.keys.searchsorted(keys), self.count - 1)
+        return np.where(self.keys[rows] == keys, rows, -1)
+
+    def get(self, index):
+        """Read-only Q-values of a canonical state string, or None."""
+        row = self.find(pack_index(index))
+        return None if row is None else self.values[row]
+
+    def items(self):
+        for key, values in zip(self.keys.tolist(), self.values):
+            yield unpack_index(key, self.cells), values
+
+    def __contains__(self, index):
+        return self.find(pack_index(index)) is not None
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        del self.keys, self.values
+        self.data.close()
+
+
+class QTable:
+    def __init__(self, width, q_init, capacity=DEFAULT_CAPACITY):
+        self.width = width
+        self.q_init = q_init
+        self.count = 0
+        self.keys = np.empty(capacity, dtype=np.uint64)
+        self.values = np.empty((capacity, width), dtype=np.float32)
+        self._rehash(1 << (2 * capacity - 1).bit_length())
+
+    @classmethod
+    def from_file(cls, table_file, q_init):
+        """Table holding a copy of every row of a ``QTableFile``."""
+        table = cls(table_file.width, q_init, max(DEFAULT_CAPACITY, table_file.count * 5 // 4))
+        table.count = table_file.count
+        table.keys[:table.count] = table_file.keys
+        table.values[:table.count] = table_file.values
+        table._rehash(len(table.slots))
+        return table
+
+    def _rehash(self, size):
+        """Rebuild the hash index with ``size`` slots (a power of two)."""
+        self.shift = 64 - (size.bit_length() - 1)
+        self.mask = size - 1
+        # slots hold row + 1, 0 being empty
+        self.slots = np.zeros(size, dtype=np.uint32)
+        pending = np.arange(self.count)
+        slot = (self.keys[:self.count] * np.uint64(HASH_MULTIPLIER)) >> np.uint64(self.shift)
+        slot = slot.astype(np.int64)
+        while pending.size:
+            free = self.slots[slot] == 0
+            # the first row aiming at a free slot takes it, the others probe on
+            taken, first = np.unique(slot[free], return_index=True)
+            winners = np.flatnonzero(free)[first]
+            self.slots[taken] = pending[winners] + 1
+            placed = np.zeros(pending.size, dtype=bool)
+            placed[winners] = True
+            pending = pending[~placed]
+            slot = (slot[~placed] + 1) & self.mask
+
+    def _slot(self, key):
+        return ((key * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> self.shift
+
+    def find(self, key):
+        """Row of a packed key, or None."""
+        slot = self._slot(key)
+        while True:
+            row = int(self.slots[slot])
+            if row == 0:
+                return None
+            if self.keys[row - 1] == key:
+                return row - 1
+            slot = (slot + 1) & self.mask
+
+    def find_many(self, keys):
+        """Rows of an array of packed keys, -1 for missing ones."""
+        keys = np.asarray(keys, dtype=np.uint64)
+        rows = np.full(len(keys), -1)
+        pending = np.arange(len(keys))
+        slot = ((keys * np.uint64(HASH_MULTIPLIER)) >> np.uint64(self.shift)).astype(np.int64)
+        while pending.size:
+            row = self.slots[slot].astype(np.int64) - 1
+            hit = (row >= 0) & (self.keys[row] == keys[pending])
+            rows[pending[hit]] = row[hit]
+            probe = (row >= 0) & ~hit
+            pending = pending[probe]
+            slot = (slot[probe] + 1) & self.mask
+        return rows
+
+    def add(self, key, values=None):
+        """Row for a new packed key, holding ``values`` or ``q_init``."""
+        if self.count == len(self.keys):
+            capacity = 2 * len(self.keys)
+            self.keys = np.resize(self.keys, capacity)
+            self.values = np.resize(self.values, (capacity, self.width))
+        if 2 * (self.count + 1) > len(self.slots):
+            self._rehash(2 * len(self.slots))
+        row = self.count
+        self.keys[row] = key
+        self.values[row] = self.q_init if values is None else values
+        self.count += 1
+        slot = self._slot(key)
+        while self.slots[slot]:
+            slot = (slot + 1) & self.mask
+        self.slots[slot] = row + 1
+        return row
+
+    def get(self, key):
+        """Q-values of a packed key, added with ``q_init`` if missing.
+
+        The row is a view into the table, valid until the next state is added.
+        """
+        row = self.find(key)
+        if row is None:
+            row = self.add(key)
+        return self.values[row]
+
+    def items(self, cells):
+        """(state string, Q-values view) of every row."""
+        for row, key in enumerate(self.keys[:self.count].tolist()):
+            yield unpack_index(key, cells), self.values[row]
+
+    def __contains__(self, key):
+        return self.find(key) is not None
+
+    def __len__(self):
+        return self.count
+
+    def save(self, path, cells, base=None):
+        """Write the table, plus the rows of the ``QTableFile`` ``base`` it
+        does not hold."""
+        keys, values = self.keys[:self.count], self.values[:self.count]
+        if base is not None:
+            missing = ~np.isin(base.keys, keys)
+            keys = np.concatenate([keys, base.keys[missing]])
+            values = np.concatenate([values, base.values[missing]])
+        save(path, keys, values, cells)
+
+
+def save(path, keys, values, cells):
+    """Write packed ``keys`` (any order, no duplicates) and their Q-values."""
+    if cells > MAX_CELLS:
+        raise ValueError(f"states of {cells} cells do not fit 64-bit keys")
+    keys = np.asarray(keys, dtype="<u8")
+    values = np.asarray(values, dtype="<f4")
+    order = np.argsort(keys, kind="stable")
+    # Replace the file at once, readers that mapped the old one keep it
+    with open(path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(keys), cells, values.shape[1]))
+        f.write(keys[order].tobytes())
+        f.write(values[order].tobytes())
+    os.replace(path + ".tmp", path)
+
+
+def save_states(path, states, width):
+    """Write a {state string: Q-values} mapping, folding mirrored states.
+
+    Returns how many states were written.
+    """
+    table = {}
+    for index, value in states.items():
+        index, mirrored = canonical_index(index, width)
+        table[pack_index(index)] = value[::-1] if mirrored else value
+    cells = len(next(iter(states))) if states else 0
+    save(path, list(table), np.array(list(table.values()), dtype="<f4").reshape(len(table), width), cells)
+    return len(table)
+
+
+def read_csv_states(path=CSV_PATH):
+    """{state string: Q-values} of a CSV table, without evaluating every row."""
+    table = read_csv(path, dtype={"states": str})
+    return {
+        index: np.array(scores.strip("[] ").replace(",", " ").split(), dtype=float)
+        for index, scores in zip(table["states"], table["scores"])
+    }
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else CSV_PATH
+    path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PATH
+    states = read_csv_states(source)
+    if not states:
+        sys.exit(f"{source} has no states")
+    width = len(next(iter(states.values())))
+    count = save_states(path, states, width)
+    print(f"{count} states written to {path}")
@@ -0,0 +1,131 @@
+"""Self-play Q-learning training over several processes.
+
+    python q_train_parallel.py [games] [workers] [games_per_second]
+
+Like ``trainQLearning`` in q_train.py, two agents (pieces 1 and 2) play each
+other with a random first player and learn from the result of every game.
+Worker processes play the games, in batches of ``batch_size``, and send the
+state/action history of both agents and the winner of each game; the learner
+applies the ``finalResult`` backups of every game to its own two agents.
+Every ``checkpoint_interval`` seconds the learner writes both tables to
+binary files (q_table.py) and workers reload them before their next batch,
+learning from their own games in between.
+"""
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import q_learning
+from q_learning import PlayQlearning, HEIGHT, WIDTH
+
+CHECKPOINT_PATHS = {1: "q_learning_table_1.bin", 2: "q_learning_table_2.bin"}
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_CHECKPOINT_INTERVAL = 30.0
+
+# state of a worker process
+_agents = None
+_generation = -1
+_rng = random.Random()
+
+
+def play_game(agent1, agent2, rng=random):
+    """Play one game between the agents and let both learn from it.
+
+    Returns (history of agent1, history of agent2, winner) before learning.
+    """
+    first, second = (agent1, agent2) if rng.random() < 0.5 else (agent2, agent1)
+    agent1.newGame()
+    agent2.newGame()
+    board = np.zeros((HEIGHT, WIDTH), dtype=int)
+    mover = first
+    while True:
+        col = mover.findBestMove(board)
+        row = np.flatnonzero(board[:, col] == 0)[-1]
+        board[row, col] = mover.player
+        winner = mover.checkWinner(board)
+        if winner != 0:
+            break
+        mover = second if mover is first else first
+    episode = list(agent1.history), list(agent2.history), winner
+    agent1.finalResult(winner)
+    agent2.finalResult(winner)
+    return episode
+
+
+def _play_games(count, generation, paths):
+    """Worker task: play ``count`` games with the tables of ``generation``."""
+    global _agents, _generation
+    if generation != _generation:
+        # a new checkpoint replaced the files, drop the old mappings
+        q_learning.open_table_file.cache_clear()
+        _agents = PlayQlearning(1, paths[1]), PlayQlearning(2, paths[2])
+        _generation = generation
+        _rng.seed(os.getpid() ^ generation)
+    return [play_game(*_agents, _rng) for _ in range(count)]
+
+
+def learn(agents, episodes):
+    """Apply the backups of played games to ``agents`` (piece 1, piece 2)."""
+    for *histories, winner in episodes:
+        for agent, history in zip(agents, histories):
+            agent.history = history
+            agent.finalResult(winner)
+    for agent in agents:
+        agent.newGame()
+
+
+def trainParallel(trainNum, workers=None, games_per_second=0, batch_size=DEFAULT_BATCH_SIZE,
+                  checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, paths=CHECKPOINT_PATHS):
+    """Train two agents on ``trainNum`` games, returns (playerQ1, playerQ2).
+
+    ``games_per_second`` caps the pace of training (0 = as fast as possible).
+    """
+    workers = workers or os.cpu_count() or 1
+    agents = PlayQlearning(1), PlayQlearning(2)
+
+    def checkpoint():
+        for agent in agents:
+            agent.saveQTable(paths[agent.player])
+
+    checkpoint()
+    generation = 0
+    last_checkpoint = start = time.perf_counter()
+    submitted = played = 0
+    pending = set()
+    with ProcessPoolExecutor(workers) as pool:
+        while played < trainNum:
+            # two batches in flight per worker keep them all busy
+            while submitted < trainNum and len(pending) < 2 * workers:
+                if games_per_second > 0:
+                    delay = start + submitted / games_per_second - time.perf_counter()
+                    if delay > 0:
+                        if pending:
+                            break
+                        time.sleep(delay)
+                count = min(batch_size, trainNum - submitted)
+                pending.add(pool.submit(_play_games, count, generation, paths))
+                submitted += count
+            done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                episodes = future.result()
+                learn(agents, episodes)
+                played += len(episodes)
+            if time.perf_counter() - last_checkpoint >= checkpoint_interval:
+                checkpoint()
+                generation += 1
+                last_checkpoint = time.perf_counter()
+                seconds = last_checkpoint - start
+                print(f"{played} games, {played / seconds:.0f} games/s, "
+                      f"{len(agents[0].QTable)} + {len(agents[1].QTable)} states")
+    checkpoint()
+    print(f"{played} games in {time.perf_counter() - start:.1f} s")
+    return agents
+
+
+if __name__ == "__main__":
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    games_per_second = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+    trainParallel(games, workers, games_per_second)
@@ -0,0 +1,394 @@
+"""Negamax principal variation search on bitboard positions.
+
+Shared by the FastAPI service (app.py), the minimax module and the local
+game. ``Searcher.iterative_deepening`` searches depth 1, 2, 3, ... until a
+wall-clock budget runs out and returns the best move of the deepest
+completed iteration. Best moves found by earlier iterations are kept in
+the transposition table and tried first by the next one, which keeps the
+deeper searches cheap.
+"""
+import math
+import random
+import time
+from bitboard import (Position, ROW_COUNT, COLUMN_COUNT, BOTTOM_MASK, BOARD_MASK,
+                      winning_cells, mask_column, mask_columns, mirror_column)
+from evaluation import IncrementalEvaluator
+from solver import Solver, SolverTimeout, SOLVER_EMPTY_CELLS, describe
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+WIN_SCORE = 10000000
+LOSS_SCORE = -1000000
+
+# Every score is a multiple of 0.5 (height bonus), so this is the smallest
+# possible window
+NULL_WINDOW = 0.5
+
+# Depth recorded for won, lost and drawn positions, deeper than any search
+TERMINAL_DEPTH = 100
+
+# Zobrist keys for the AI piece and side to move: values are from the AI's
+# point of view, so both are part of the transposition table key
+_key_random = random.Random(0x5EA4C4)
+PERSPECTIVE_KEYS = [[_key_random.getrandbits(64) for _ in range(2)] for _ in range(3)]
+
+# Move ordering modes: killer/history heuristics, or scoring every child
+HISTORY_ORDERING = "history"
+EVALUATION_ORDERING = "evaluation"
+
+# With the history ordering, nodes with at least this much depth left still
+# score every child: their subtrees are big enough to pay for it
+EVALUATION_ORDERING_DEPTH = 4
+
+# Static fallback order, center columns first
+CENTER_ORDER = [3, 2, 4, 1, 5, 0, 6]
+
+# How many nodes to visit between two clock checks
+TIME_CHECK_INTERVAL = 1024
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def prepare_position(board):
+    """Position with an incremental evaluator attached, from a board or Position."""
+    position = board if isinstance(board, Position) else Position(board)
+    if position.evaluator is None:
+        IncrementalEvaluator(position)
+    return position
+
+
+class Searcher:
+    def __init__(self, ai_piece, transposition_table=None, ordering=HISTORY_ORDERING,
+                 solver=None, solver_empty_cells=SOLVER_EMPTY_CELLS, opening_book=None,
+                 stop_event=None):
+        self.ai_piece = ai_piece
+        self.player_piece = 3 - ai_piece
+        if transposition_table is None:
+            transposition_table = TranspositionTable()
+        self.transposition_table = transposition_table
+        self.ordering = ordering
+        # Endgames with at most solver_empty_cells empty cells are solved
+        # exactly (0 turns the solver off)
+        self.solver = solver
+        self.solver_empty_cells = solver_empty_cells
+        self.solved = None  # ("win" | "loss" | "draw", plies) of the last solve
+        self.opening_book = opening_book
+        # Two killer moves per ply (number of discs on the board)
+        self.killers = [[None, None] for _ in range(ROW_COUNT * COLUMN_COUNT + 1)]
+        # history[piece][col * ROW_COUNT + height]: cutoffs caused by that drop
+        self.history = [[0] * (ROW_COUNT * COLUMN_COUNT) for _ in range(3)]
+        self.deadline = None
+        # Anything with is_set() (threading or multiprocessing Event): when
+        # set, the search stops like on a timeout (used to cancel pondering)
+        self.stop_event = stop_event
+        self.nodes = 0
+
+    def table_key(self, position, ai_to_move):
+        """Transposition table key and whether it is the mirrored position's."""
+        key, mirrored = position.canonical_hash()
+        return key ^ PERSPECTIVE_KEYS[self.ai_piece][ai_to_move], mirrored
+
+    def order_moves(self, position, piece, tt_move=None):
+        """Cheap move ordering: TT move, killers, history, then center first."""
+        heights = position.heights
+        history = self.history[piece]
+        moves = [col for col in CENTER_ORDER if heights[col] < ROW_COUNT]
+        # sort is stable, so equal history keeps the center-first order
+        moves.sort(key=lambda col: history[col * ROW_COUNT + heights[col]], reverse=True)
+
+        front = 0
+        for col in (tt_move, *self.killers[len(position.moves)]):
+            if col is not None and col in moves and moves.index(col) >= front:
+                moves.remove(col)
+                moves.insert(front, col)
+                front += 1
+        return moves
+
+    def record_cutoff(self, position, piece, col, depth):
+        killers = self.killers[len(position.moves)]
+        if killers[0] != col:
+            killers[1] = killers[0]
+            killers[0] = col
+        self.history[piece][col * ROW_COUNT + position.heights[col]] += depth * depth
+
+    def sort_valid_moves(self, position, valid_moves, piece, tt_move=None):
+        """Ordering by the evaluation of every child (ordering="evaluation")."""
+        scored_moves = []
+        for col in valid_moves:
+            position.make_move(col, piece)
+            score = position.evaluator.score(piece)
+            position.undo_move()
+            scored_moves.append((col, score))
+        scored_moves.sort(key=lambda x: x[1], reverse=True)
+        ordered = [col for col, _ in scored_moves]
+
+        # Best move stored in the transposition table goes first
+        if tt_move is not None and tt_move in ordered:
+            ordered.remove(tt_move)
+            ordered.insert(0, tt_move)
+        return ordered
+
+    def evaluate(self, position, piece):
+        """Leaf value from the point of view of ``piece``, the side to move.
+
+        score_position is not symmetric between the two players, so leaves
+        are always scored for the AI and negated on the opponent's turn.
+        """
+        value = position.evaluator.score(self.ai_piece)
+        return value if piece == self.ai_piece else -value
+
+    def terminal_value(self, position, piece, valid_moves):
+        """Value of a won, lost or drawn position for ``piece``, or None."""
+        if position.is_win(self.ai_piece):
+            value = WIN_SCORE
+        elif position.is_win(self.player_piece):
+            value = LOSS_SCORE
+        elif len(valid_moves) == 0:
+            value = 0
+        else:
+            return None
+        return value if piece == self.ai_piece else -value
+
+    def win_value(self, winner, piece):
+        """Value for ``piece`` of a game won by ``winner``."""
+        value = WIN_SCORE if winner == self.ai_piece else LOSS_SCORE
+        return value if piece == self.ai_piece else -value
+
+    def threat_moves(self, position, piece):
+        """Pre-search pass over immediate threats for ``piece`` to move.
+
+        Returns (moves, value). ``value`` is known without searching when
+        ``piece`` wins right away or cannot stop the opponent from winning
+        on the next move; ``moves`` then holds the move to play. Otherwise
+        ``value`` is None and ``moves`` are the columns worth searching: the
+        forced block if the opponent threatens to win, minus the moves that
+        let the opponent win on the cell right above.
+        """
+        opp_piece = 3 - piece
+        occupied = position.occupied()
+        playable = (occupied + BOTTOM_MASK) & BOARD_MASK
+        wins = winning_cells(position.bitboards[piece], occupied) & playable
+        if wins:
+            return [mask_column(wins)], self.win_value(piece, piece)
+
+        opp_cells = winning_cells(position.bitboards[opp_piece], occupied)
+        forced = opp_cells & playable
+        if forced:
+            if forced & (forced - 1):
+                # Two threats, only one can be blocked
+                return [mask_column(forced)], self.win_value(opp_piece, piece)
+            playable = forced
+        safe = playable & ~(opp_cells >> 1)
+        if not safe:
+            return [mask_column(playable)], self.win_value(opp_piece, piece)
+        return mask_columns(safe), None
+
+    def negamax(self, position, depth, alpha, beta, piece):
+        """Principal variation search for ``piece`` to move.
+
+        Returns (column, score) with the score from the point of view of
+        ``piece``. The first, best-ordered move is searched with the full
+        window and the others with a null window, re-searching only the
+        moves that turn out better.
+        """
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0:
+            if self.deadline is not None and time.perf_counter() > self.deadline:
+                raise SearchTimeout()
+            if self.stop_event is not None and self.stop_event.is_set():
+                raise SearchTimeout()
+
+        # Check transposition table
+        alpha_orig = alpha
+        table_key, mirrored = self.table_key(position, piece == self.ai_piece)
+        entry = self.transposition_table.probe(table_key)
+        tt_move = None
+        if entry is not None:
+            entry_depth, flag, value, tt_move = entry
+            if mirrored and tt_move is not None:
+                tt_move = mirror_column(tt_move)
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return tt_move, value
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return tt_move, value
+
+        # Check terminal conditions
+        valid_moves = position.get_valid_moves()
+        value = self.terminal_value(position, piece, valid_moves)
+        if value is not None:
+            # Final results hold at any depth
+            self.transposition_table.store(table_key, TERMINAL_DEPTH, EXACT, value, None)
+            return None, value
+        if depth == 0:
+            value = self.evaluate(position, piece)
+            self.transposition_table.store(table_key, 0, EXACT, value, None)
+            return None, value
+
+        # Immediate wins, forced blocks and moves that hand over a win
+        moves, value = self.threat_moves(position, piece)
+        if value is not None:
+            stored_move = mirror_column(moves[0]) if mirrored else moves[0]
+            self.transposition_table.store(table_key, TERMINAL_DEPTH, EXACT, value, stored_move)
+            return moves[0], value
+
+        opp_piece = 3 - piece
+        value = -math.inf
+        column = None
+        if self.ordering == EVALUATION_ORDERING or depth >= EVALUATION_ORDERING_DEPTH:
+            ordered_moves = self.sort_valid_moves(position, valid_moves, piece, tt_move)
+        else:
+            ordered_moves = self.order_moves(position, piece, tt_move)
+        if len(moves) < len(valid_moves):
+            ordered_moves = [col for col in ordered_moves if col in moves]
+        for col in ordered_moves:
+            position.make_move(col, piece)
+            try:
+                if column is None:
+                    score = -self.negamax(position, depth - 1, -beta, -alpha, opp_piece)[1]
+                else:
+                    # Null window probe: can this move beat alpha at all?
+                    score = -self.negamax(position, depth - 1, -alpha - NULL_WINDOW, -alpha, opp_piece)[1]
+                    if alpha < score < beta:
+                        score = -self.negamax(position, depth - 1, -beta, -alpha, opp_piece)[1]
+            finally:
+                position.undo_move()
+            if score > value:
+                value = score
+                column = col
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                self.record_cutoff(position, piece, col, depth)
+                break
+
+        if value <= alpha_orig:
+            flag = UPPER
+        elif value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        stored_move = mirror_column(column) if mirrored and column is not None else column
+        self.transposition_table.store(table_key, depth, flag, value, stored_move)
+        return column, value
+
+    def principal_variation(self, position, length=ROW_COUNT * COLUMN_COUNT):
+        """Expected line of play from ``position`` (AI to move), from the table."""
+        position = prepare_position(position)
+        line = []
+        piece = self.ai_piece
+        while len(line) < length:
+            table_key, mirrored = self.table_key(position, piece == self.ai_piece)
+            entry = self.transposition_table.probe(table_key)
+            if entry is None or entry[3] is None:
+                break
+            col = mirror_column(entry[3]) if mirrored else entry[3]
+            if not position.can_play(col):
+                break
+            position.make_move(col, piece)
+            line.append(col)
+            if position.is_win(piece):
+                break
+            piece = 3 - piece
+        for _ in line:
+            position.undo_move()
+        return line
+
+    def search(self, position, depth):
+        """Fixed-depth search for the AI to move, returns (column, score)."""
+        position = prepare_position(position)
+        self.transposition_table.new_search()
+        return self.negamax(position, depth, -math.inf, math.inf, self.ai_piece)
+
+    def solve(self, position, deadline=None):
+        """Exact result for the AI to move, returns (column, score).
+
+        Solved wins score above WIN_SCORE and solved losses below
+        LOSS_SCORE, faster wins and slower losses being worth more; a
+        solved draw is 0.
+        """
+        if self.solver is None:
+            self.solver = Solver()
+        col, score = self.solver.solve(position, self.ai_piece, deadline, self.stop_event)
+        self.solved = describe(score, len(position.moves))
+        if score > 0:
+            score += WIN_SCORE
+        elif score < 0:
+            score += LOSS_SCORE
+        return col, score
+
+    def root_result(self, position, deadline):
+        """(column, score, depth) for the AI to move when no search is
+        needed: no move left, a book position, a move forced by immediate
+        threats or an endgame solved before ``deadline``. None otherwise.
+        """
+        self.solved = None
+        if not position.get_valid_moves():
+            return None, None, 0
+
+        # Book positions were searched offline
+        if self.opening_book is not None:
+            entry = self.opening_book.probe(position, self.ai_piece)
+            if entry is not None:
+                return entry
+
+        # Positions decided by immediate threats need no search at all
+        moves, value = self.threat_moves(position, self.ai_piece)
+        if value is not None or len(moves) == 1:
+            if value is None:
+                position.make_move(moves[0], self.ai_piece)
+                value = position.evaluator.score(self.ai_piece)
+                position.undo_move()
+            return moves[0], value, 0
+
+        empty_cells = ROW_COUNT * COLUMN_COUNT - len(position.moves)
+        if empty_cells <= self.solver_empty_cells:
+            try:
+                col, score = self.solve(position, deadline)
+                return col, score, empty_cells
+            except SolverTimeout:
+                pass  # search with what is left of the budget
+        return None
+
+    def iterative_deepening(self, position, time_budget, max_depth=None):
+        """Search deeper and deeper until ``time_budget`` seconds are spent.
+
+        Returns (column, score, depth) of the deepest completed iteration.
+        Depth 1 always runs to completion so there is always a move.
+        Endgames are solved exactly instead, the depth then being the number
+        of empty cells, unless the solver runs out of time. Positions of the
+        opening book are answered from the book.
+        """
+        position = prepare_position(position)
+        self.transposition_table.new_search()
+        start = time.perf_counter()
+        result = self.root_result(position, start + time_budget)
+        if result is not None:
+            return result
+
+        empty_cells = ROW_COUNT * COLUMN_COUNT - len(position.moves)
+        if max_depth is None or max_depth > empty_cells:
+            max_depth = empty_cells
+
+        best_col, best_score, completed = None, None, 0
+        for depth in range(1, max_depth + 1):
+            self.deadline = start + time_budget if depth > 1 else None
+            try:
+                best_col, best_score = self.negamax(position, depth, -math.inf, math.inf, self.ai_piece)
+            except SearchTimeout:
+                break
+            finally:
+                self.deadline = None
+            completed = depth
+            if self.stop_event is not None and self.stop_event.is_set():
+                break
+            # A forced result does not change with more depth
+            if abs(best_score) >= -LOSS_SCORE:
+                break
+            if time.perf_counter() - start >= time_budget:
+                break
+        return best_col, best_score, completed
@@ -0,0 +1,76 @@
+"""On-disk cache of deep search results, shared by processes and restarts.
+
+Transposition table entries (key, depth, bound, value, best move) of at
+least ``min_depth`` are snapshotted to a SQLite file and loaded back into a
+fresh table at startup. The file is in WAL mode so several worker processes
+can read it while one of them writes a snapshot; a key already on disk is
+only overwritten by a result at least as deep.
+"""
+import sqlite3
+
+DEFAULT_PATH = "data/search_cache.sqlite3"
+
+# Shallow entries are cheap to recompute and would only bloat the file
+DEFAULT_MIN_DEPTH = 4
+
+_SIGN_BIT = 1 << 63
+
+
+def _to_signed(key):
+    # SQLite integers are signed 64-bit, Zobrist keys are unsigned
+    return key - (1 << 64) if key & _SIGN_BIT else key
+
+
+def _to_unsigned(key):
+    return key + (1 << 64) if key < 0 else key
+
+
+class SearchCache:
+    def __init__(self, path=DEFAULT_PATH, min_depth=DEFAULT_MIN_DEPTH):
+        self.path = path
+        self.min_depth = min_depth
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key INTEGER PRIMARY KEY, depth INTEGER, flag INTEGER, value REAL, move INTEGER)"
+        )
+        self.connection.commit()
+
+    def snapshot(self, transposition_table):
+        """Write the deep entries of ``transposition_table``, returns how many."""
+        rows = [
+            (_to_signed(key), depth, flag, value, move)
+            for key, depth, flag, value, move in transposition_table.entries(self.min_depth)
+        ]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO entries VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET depth = excluded.depth, flag = excluded.flag, "
+                "value = excluded.value, move = excluded.move WHERE excluded.depth >= entries.depth",
+                rows,
+            )
+        return len(rows)
+
+    def load(self, transposition_table, limit=-1):
+        """Store the ``limit`` deepest cached entries (-1: all) in ``transposition_table``.
+
+        Entries are stored shallowest first so the deepest ones end up in
+        the depth-preferred slots. Returns how many were read.
+        """
+        rows = self.connection.execute(
+            "SELECT * FROM (SELECT key, depth, flag, value, move FROM entries "
+            "ORDER BY depth DESC LIMIT ?) ORDER BY depth",
+            (limit,),
+        )
+        count = 0
+        for key, depth, flag, value, move in rows:
+            transposition_table.store(_to_unsigned(key), depth, flag, value, move)
+            count += 1
+        return count
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,185 @@
+"""Search state of one worker process of the FastAPI service.
+
+app.py runs every search in a process pool, so searches neither block the
+event loop nor compete for one GIL. Each worker process builds its own
+transposition table, endgame solver and opening book in ``init_worker``
+and keeps them warm between requests. Settings come from the environment
+of the service. Games with a ``game_id`` always go to the same worker and
+search with the state of their own session (``sessions.py``). Between two
+moves of a game the worker ponders: it searches the position after the
+expected reply, and stops as soon as a live request comes in.
+"""
+import os
+import threading
+import time
+from multiprocessing import util
+from bitboard import Position
+from search import Searcher, prepare_position
+from solver import Solver, SOLVER_EMPTY_CELLS
+from opening_book import OpeningBook, DEFAULT_PATH
+from search_cache import SearchCache, DEFAULT_PATH as SEARCH_CACHE_PATH
+from sessions import SessionStore, SESSION_TABLE_CAPACITY, MAX_SESSIONS, SESSION_IDLE_TIMEOUT
+from transposition import TranspositionTable, DEFAULT_CAPACITY
+
+TABLE_CAPACITY = int(os.environ.get("TABLE_CAPACITY", str(DEFAULT_CAPACITY)))
+MAX_SEARCH_DEPTH = int(os.environ.get("MAX_SEARCH_DEPTH", "42"))
+
+# Endgames with this many empty cells or fewer are solved exactly (0 = off)
+SOLVER_EMPTY_CELLS = int(os.environ.get("SOLVER_EMPTY_CELLS", str(SOLVER_EMPTY_CELLS)))
+
+# Opening book built with opening_book.py, memory-mapped if the file exists
+OPENING_BOOK = os.environ.get("OPENING_BOOK", DEFAULT_PATH)
+
+# Deep search results saved across restarts and shared by workers, every
+# SNAPSHOT_INTERVAL seconds by a background thread and on shutdown (empty
+# SEARCH_CACHE = off)
+SEARCH_CACHE = os.environ.get("SEARCH_CACHE", SEARCH_CACHE_PATH)
+SNAPSHOT_INTERVAL = float(os.environ.get("SNAPSHOT_INTERVAL", "300"))
+
+# Per-game sessions of each worker: table size, how many, idle seconds
+SESSION_TABLE_CAPACITY = int(os.environ.get("SESSION_TABLE_CAPACITY", str(SESSION_TABLE_CAPACITY)))
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", str(MAX_SESSIONS)))
+SESSION_IDLE_TIMEOUT = float(os.environ.get("SESSION_IDLE_TIMEOUT", str(SESSION_IDLE_TIMEOUT)))
+
+transposition_table = None
+solver = None
+opening_book = None
+search_cache = None
+sessions = None
+stop_event = None  # set by the service when live work is queued for this worker
+snapshot_lock = threading.Lock()
+
+
+def init_worker(stop=None):
+    """Pool initializer: build the search state of this process."""
+    global transposition_table, solver, opening_book, search_cache, sessions, stop_event
+    stop_event = stop
+    transposition_table = TranspositionTable(TABLE_CAPACITY)
+    sessions = SessionStore(MAX_SESSIONS, SESSION_IDLE_TIMEOUT, SESSION_TABLE_CAPACITY,
+                            shared_table=transposition_table)
+    solver = Solver()
+    if os.path.exists(OPENING_BOOK):
+        opening_book = OpeningBook(OPENING_BOOK)
+    if SEARCH_CACHE:
+        search_cache = SearchCache(SEARCH_CACHE)
+        count = search_cache.load(transposition_table, TABLE_CAPACITY)
+        print(f"Đã nạp {count} kết quả tìm kiếm từ {SEARCH_CACHE}")
+        # Snapshots run beside the searches, not inside a request
+        threading.Thread(target=snapshot_loop, daemon=True).start()
+        # Save once more when the pool shuts this process down
+        util.Finalize(None, snapshot, exitpriority=10)
+
+
+def ready():
+    """No-op task: submitting it starts the worker and runs ``init_worker``."""
+    return transposition_table is not None
+
+
+def snapshot():
+    with snapshot_lock:
+        # Results of live games go to the cache too
+        sessions.merge_all()
+        count = search_cache.snapshot(transposition_table)
+    print(f"Đã lưu {count} kết quả tìm kiếm vào {SEARCH_CACHE}")
+    return count
+
+
+def snapshot_loop():
+    # Table entries are tuples replaced whole, so the snapshot reads a
+    # consistent entry from every slot while a search is storing
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+        snapshot()
+
+
+def expect_reply(session, position, line):
+    """Remember ``line`` and the position to ponder on: after the AI's move
+    and the reply the line expects, unless that reply wins."""
+    session.principal_variation = line
+    if len(line) >= 2:
+        position.make_move(line[0], session.ai_piece)
+        position.make_move(line[1], 3 - session.ai_piece)
+        if not position.is_win(3 - session.ai_piece):
+            session.ponder_board = position.to_board()
+        position.undo_move()
+        position.undo_move()
+
+
+def search_move(board, ai_piece, time_budget, game_id=None, new_game=False):
+    """Best move for ``ai_piece`` to move.
+
+    Returns (column, score, depth, solved, principal_variation). Without a
+    ``game_id`` the search uses the table shared by all games of this worker.
+    """
+    if transposition_table is None:
+        init_worker()
+    if stop_event is not None:
+        stop_event.clear()
+    position = prepare_position(board)
+    session = None
+    table = transposition_table
+    if game_id is not None:
+        session = sessions.get(game_id, ai_piece, new_game)
+        table = session.transposition_table
+        # Ponder hit: the reply was the expected one and pondering searched
+        # at least as long as this request may
+        result = session.ponder_result
+        session.ponder_board = session.ponder_result = None
+        if result is not None and result[0] == position.key() and result[4] >= time_budget:
+            col, score, depth = result[1:4]
+            # Pondering filled the session table with the line from here
+            line = Searcher(ai_piece, table).principal_variation(position)
+            if line[:1] != [col]:
+                line = [col]
+            expect_reply(session, position, line)
+            print(f"Trúng dự đoán: {game_id}")
+            return col, score, depth, None, line
+    searcher = Searcher(ai_piece, table, solver=solver,
+                        solver_empty_cells=SOLVER_EMPTY_CELLS, opening_book=opening_book)
+    col, score, depth = searcher.iterative_deepening(position, time_budget, MAX_SEARCH_DEPTH)
+    # Book moves and solved endgames are not in the table
+    line = searcher.principal_variation(position)
+    if col is not None and line[:1] != [col]:
+        line = [col]
+    if session is not None:
+        expect_reply(session, position, line)
+    return col, score, depth, searcher.solved, line
+
+
+def ponder_move(game_id, time_budget):
+    """Search the expected next position of a game until ``time_budget``
+    seconds are spent or live work comes in."""
+    session = sessions.sessions.get(game_id) if sessions is not None else None
+    if session is None or session.ponder_board is None:
+        return
+    if stop_event is not None and stop_event.is_set():
+        return
+    position = prepare_position(Position(session.ponder_board))
+    searcher = Searcher(session.ai_piece, session.transposition_table, solver=solver,
+                        solver_empty_cells=SOLVER_EMPTY_CELLS, opening_book=opening_book,
+                        stop_event=stop_event)
+    start = time.perf_counter()
+    col, score, depth = searcher.iterative_deepening(position, time_budget, MAX_SEARCH_DEPTH)
+    if col is not None:
+        session.ponder_result = position.key(), col, score, depth, time.perf_counter() - start
+
+
+def search_batch(positions, time_budget, max_depth=None):
+    """Search (board or Position, ai_piece) pairs with the shared table,
+    returns [(column, score, depth)]."""
+    if transposition_table is None:
+        init_worker()
+    if stop_event is not None:
+        stop_event.clear()
+    if max_depth is None or max_depth > MAX_SEARCH_DEPTH:
+        max_depth = MAX_SEARCH_DEPTH
+    results = []
+    for board, ai_piece in positions:
+        position = prepare_position(board)
+        if position.is_win(1) or position.is_win(2):
+            results.append((None, None, 0))
+            continue
+        searcher = Searcher(ai_piece, transposition_table, solver=solver,
+                            solver_empty_cells=SOLVER_EMPTY_CELLS, opening_book=opening_book)
+        results.append(searcher.iterative_deepening(position, time_budget, max_depth))
+    return results
@@ -0,0 +1,84 @@
+"""Per-game search state for the service.
+
+Clients that send a ``game_id`` get a ``Session`` of their own in the
+worker process that serves the game: the side the AI plays, a small
+transposition table that no other game can overwrite, so the next move
+reuses the tree searched for this one, the principal variation of the
+last search and what pondering found for the expected reply. Sessions live in an LRU store and are dropped when they have
+been idle too long or when the store is full.
+
+Session tables fall back to the worker's shared table (warmed from the
+search cache) on a miss, and their deep entries are merged back into it
+when the session is dropped and before every snapshot of the cache.
+"""
+import time
+from collections import OrderedDict
+from transposition import TranspositionTable
+
+SESSION_TABLE_CAPACITY = 1 << 15
+MAX_SESSIONS = 128
+SESSION_IDLE_TIMEOUT = 30 * 60  # seconds
+
+# Session entries at least this deep go back to the shared table, the
+# depth the search cache keeps
+MERGE_DEPTH = 4
+
+
+class Session:
+    def __init__(self, ai_piece, table_capacity=SESSION_TABLE_CAPACITY, shared_table=None):
+        self.ai_piece = ai_piece
+        self.transposition_table = TranspositionTable(table_capacity, fallback=shared_table)
+        self.principal_variation = []  # expected line after the last search
+        self.ponder_board = None  # board after the AI move and the expected reply
+        self.ponder_result = None  # (position key, column, score, depth, seconds)
+        self.last_used = time.monotonic()
+
+
+class SessionStore:
+    def __init__(self, max_sessions=MAX_SESSIONS, idle_timeout=SESSION_IDLE_TIMEOUT,
+                 table_capacity=SESSION_TABLE_CAPACITY, shared_table=None, merge_depth=MERGE_DEPTH):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.table_capacity = table_capacity
+        self.shared_table = shared_table
+        self.merge_depth = merge_depth
+        self.sessions = OrderedDict()  # least recently used first
+
+    def get(self, game_id, ai_piece, new_game=False):
+        """Session of ``game_id``, a fresh one for a new game or another side."""
+        self.evict_idle()
+        session = self.sessions.pop(game_id, None)
+        if session is None or new_game or session.ai_piece != ai_piece:
+            if session is not None:
+                self.merge(session)
+            session = Session(ai_piece, self.table_capacity, self.shared_table)
+        session.last_used = time.monotonic()
+        self.sessions[game_id] = session
+        while len(self.sessions) > self.max_sessions:
+            self.merge(self.sessions.popitem(last=False)[1])
+        return session
+
+    def merge(self, session):
+        """Store the deep entries of ``session``'s table in the shared table."""
+        if self.shared_table is None:
+            return
+        for entry in session.transposition_table.entries(self.merge_depth):
+            self.shared_table.store(*entry)
+
+    def merge_all(self):
+        # A copy: the snapshot thread of a worker merges while requests
+        # add and drop sessions
+        for session in list(self.sessions.values()):
+            self.merge(session)
+
+    def evict_idle(self):
+        deadline = time.monotonic() - self.idle_timeout
+        while self.sessions:
+            game_id, session = next(iter(self.sessions.items()))
+            if session.last_used > deadline:
+                break
+            del self.sessions[game_id]
+            self.merge(session)
+
+    def __len__(self):
+        return len(self.sessions)
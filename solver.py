@@ -0,0 +1,175 @@
+"""Exact endgame solver.
+
+With few empty cells left the game can be solved outright instead of
+searched with the heuristic ``score_position``. The solver only scores wins
+and losses: a position won with the disc number ``d`` (counting every disc
+on the board) is worth ``43 - d`` to the winner, so faster wins score
+higher, a draw is 0 and losses are negative. Positions are plain bitboards
+(discs of the side to move, all discs) and are keyed on ``current + mask``,
+which is unique for a position with a given side to move; values do not
+depend on the colour of the pieces, so both players share the entries.
+"""
+import time
+from bitboard import (ROW_COUNT, COLUMN_COUNT, BOTTOM_MASK, BOARD_MASK, COLUMN_MASKS,
+                      winning_cells, mask_column)
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+BOARD_CELLS = ROW_COUNT * COLUMN_COUNT
+
+# Positions with this many empty cells or fewer are solved exactly
+SOLVER_EMPTY_CELLS = 20
+
+# The solver keeps its own table, values are not comparable with the
+# heuristic search's
+SOLVER_CAPACITY = 1 << 18
+
+CENTER_ORDER = [3, 2, 4, 1, 5, 0, 6]
+
+# How many nodes to visit between two clock and stop event checks, as in
+# the search
+TIME_CHECK_INTERVAL = 1024
+
+
+class SolverTimeout(Exception):
+    pass
+
+
+def describe(score, discs):
+    """("win" | "loss" | "draw", plies until the game ends) for a solved score.
+
+    ``score`` is from the point of view of the side to move and ``discs`` is
+    the number of discs on the board when it was solved.
+    """
+    if score == 0:
+        return "draw", BOARD_CELLS - discs
+    plies = BOARD_CELLS + 1 - abs(score) - discs
+    return ("win" if score > 0 else "loss"), plies
+
+
+class Solver:
+    def __init__(self, transposition_table=None):
+        if transposition_table is None:
+            transposition_table = TranspositionTable(SOLVER_CAPACITY)
+        self.transposition_table = transposition_table
+        self.deadline = None
+        self.stop_event = None
+        self.nodes = 0
+
+    def negamax(self, current, mask, discs, alpha, beta):
+        """Alpha-beta on bitboards, ``current`` being the discs of the side to move."""
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0:
+            if self.deadline is not None and time.perf_counter() > self.deadline:
+                raise SolverTimeout()
+            if self.stop_event is not None and self.stop_event.is_set():
+                raise SolverTimeout()
+
+        playable = (mask + BOTTOM_MASK) & BOARD_MASK
+        if winning_cells(current, mask) & playable:
+            return BOARD_CELLS - discs
+
+        # Forced blocks and moves right under an opponent's winning cell
+        opponent = current ^ mask
+        opp_cells = winning_cells(opponent, mask)
+        forced = opp_cells & playable
+        if forced:
+            if forced & (forced - 1):
+                return discs + 1 - BOARD_CELLS
+            playable = forced
+        safe = playable & ~(opp_cells >> 1)
+        if not safe:
+            return discs + 1 - BOARD_CELLS
+        if discs >= BOARD_CELLS - 2:
+            return 0
+
+        # Neither side can win within the next two plies
+        alpha = max(alpha, discs + 3 - BOARD_CELLS)
+        beta = min(beta, BOARD_CELLS - 2 - discs)
+        key = current + mask
+        entry = self.transposition_table.probe(key)
+        if entry is not None:
+            _, flag, value, _ = entry
+            if flag == EXACT:
+                return value
+            if flag == LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+        if alpha >= beta:
+            return alpha
+
+        # Moves creating the most winning cells first, center first on ties
+        moves = []
+        for col in CENTER_ORDER:
+            move = safe & COLUMN_MASKS[col]
+            if move:
+                threats = winning_cells(current | move, mask | move).bit_count()
+                moves.append((threats, move))
+        moves.sort(key=lambda x: x[0], reverse=True)
+
+        alpha_orig = alpha
+        value = -BOARD_CELLS
+        for _, move in moves:
+            score = -self.negamax(opponent, mask | move, discs + 1, -beta, -alpha)
+            if score > value:
+                value = score
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        if value <= alpha_orig:
+            flag = UPPER
+        elif value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.transposition_table.store(key, BOARD_CELLS - discs, flag, value, None)
+        return value
+
+    def solve(self, position, piece, deadline=None, stop_event=None):
+        """Best column and exact score for ``piece`` to move.
+
+        Returns (column, score), the score as described in the module
+        docstring. Raises SolverTimeout if ``deadline`` (a
+        ``time.perf_counter`` value) passes or ``stop_event`` is set first.
+        """
+        current = position.bitboards[piece]
+        mask = position.occupied()
+        discs = len(position.moves)
+        playable = (mask + BOTTOM_MASK) & BOARD_MASK
+        if not playable:
+            return None, 0
+        wins = winning_cells(current, mask) & playable
+        if wins:
+            return mask_column(wins), BOARD_CELLS - discs
+
+        self.deadline = deadline
+        self.stop_event = stop_event
+        try:
+            # Narrow the score down with null window searches, trying
+            # scores near 0 first
+            low = discs + 1 - BOARD_CELLS
+            high = BOARD_CELLS - discs
+            while low < high:
+                middle = low + (high - low) // 2
+                if middle <= 0 and low // 2 < middle:
+                    middle = low // 2
+                elif middle >= 0 and high // 2 > middle:
+                    middle = high // 2
+                value = self.negamax(current, mask, discs, middle, middle + 1)
+                if value <= middle:
+                    high = value
+                else:
+                    low = value
+            score = low
+
+            # First move that reaches the score, the last one needs no check
+            moves = [col for col in CENTER_ORDER if playable & COLUMN_MASKS[col]]
+            for col in moves[:-1]:
+                move = playable & COLUMN_MASKS[col]
+                if -self.negamax(current ^ mask, mask | move, discs + 1, -score, 1 - score) >= score:
+                    return col, score
+            return moves[-1], score
+        finally:
+            self.deadline = None
+            self.stop_event = None
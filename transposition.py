@@ -0,0 +1,73 @@
+"""Fixed-capacity transposition table for the alpha-beta search.
+
+Entries are stored in buckets of two slots. The first slot is
+depth-preferred: it keeps the deepest result unless that result comes from
+an older search. The second slot is always replaced. Each entry records
+the search depth, whether the value is exact or only a lower/upper bound
+(after an alpha-beta cutoff) and the best move, so results can be reused
+across depths and searches while memory stays flat. A table may have a
+``fallback`` table that is probed, but never written, on a miss.
+"""
+
+EXACT = 0
+LOWER = 1  # value is a lower bound (fail high)
+UPPER = 2  # value is an upper bound (fail low)
+
+DEFAULT_CAPACITY = 1 << 20
+
+
+class TranspositionTable:
+    def __init__(self, capacity=DEFAULT_CAPACITY, fallback=None):
+        # An odd bucket count spreads structured keys over the buckets
+        self.buckets = max(1, capacity // 2) | 1
+        self.slots = [None] * (2 * self.buckets)
+        self.generation = 0
+        self.fallback = fallback
+        self.hits = 0
+        self.stores = 0
+
+    def new_search(self):
+        """Age existing entries so a new search may overwrite them."""
+        self.generation += 1
+
+    def clear(self):
+        self.slots = [None] * (2 * self.buckets)
+
+    def probe(self, key):
+        """Return (depth, flag, value, best_move) stored for ``key`` or None."""
+        index = 2 * (key % self.buckets)
+        slots = self.slots
+        for entry in (slots[index], slots[index + 1]):
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry[1], entry[2], entry[3], entry[4]
+        if self.fallback is not None:
+            return self.fallback.probe(key)
+        return None
+
+    def store(self, key, depth, flag, value, best_move):
+        index = 2 * (key % self.buckets)
+        slots = self.slots
+        entry = (key, depth, flag, value, best_move, self.generation)
+        self.stores += 1
+
+        preferred = slots[index]
+        if (preferred is None or preferred[0] == key or depth >= preferred[1]
+                or preferred[5] != self.generation):
+            # Keep the replaced entry around in the always-replace slot
+            if preferred is not None and preferred[0] != key:
+                slots[index + 1] = preferred
+            elif slots[index + 1] is not None and slots[index + 1][0] == key:
+                slots[index + 1] = None
+            slots[index] = entry
+        else:
+            slots[index + 1] = entry
+
+    def entries(self, min_depth=0):
+        """Yield (key, depth, flag, value, best_move) of the stored entries."""
+        for entry in self.slots:
+            if entry is not None and entry[1] >= min_depth:
+                yield entry[:5]
+
+    def __len__(self):
+        return sum(1 for entry in self.slots if entry is not None)
@@ -0,0 +1,92 @@
+"""Precomputed four-cell windows of the 6x7 board.
+
+Cells are ``(row, col)`` pairs with row 0 at the top, as in the list and
+ndarray boards. The tables are built once at import and shared by
+``score_position``, the incremental evaluator, the threat scan and
+``winning_move``, so none of them rebuild coordinates per call.
+"""
+import numpy as np
+from bitboard import ROW_COUNT, COLUMN_COUNT
+
+WINDOW_LENGTH = 4
+
+
+def _build_windows():
+    windows = []
+    horizontal = []
+    for r in range(ROW_COUNT):
+        for c in range(COLUMN_COUNT - 3):
+            windows.append(tuple((r, c + i) for i in range(WINDOW_LENGTH)))
+            horizontal.append(True)
+    for c in range(COLUMN_COUNT):
+        for r in range(ROW_COUNT - 3):
+            windows.append(tuple((r + i, c) for i in range(WINDOW_LENGTH)))
+            horizontal.append(False)
+    for r in range(ROW_COUNT - 3):
+        for c in range(COLUMN_COUNT - 3):
+            windows.append(tuple((r + i, c + i) for i in range(WINDOW_LENGTH)))
+            horizontal.append(False)
+    for r in range(ROW_COUNT - 3):
+        for c in range(COLUMN_COUNT - 3):
+            windows.append(tuple((r + 3 - i, c + i) for i in range(WINDOW_LENGTH)))
+            horizontal.append(False)
+    return tuple(windows), tuple(horizontal)
+
+
+# All 69 windows, and whether each one is horizontal (only horizontal
+# windows get the "playable" check in score_position)
+WINDOWS, IS_HORIZONTAL = _build_windows()
+
+# CELL_WINDOWS[r][c]: indices of the windows containing cell (r, c)
+CELL_WINDOWS = [[[] for _ in range(COLUMN_COUNT)] for _ in range(ROW_COUNT)]
+for _w, _cells in enumerate(WINDOWS):
+    for _r, _c in _cells:
+        CELL_WINDOWS[_r][_c].append(_w)
+
+# PLAYABLE_WINDOWS[r][c]: horizontal windows whose "playable" check reads
+# cell (r, c), i.e. the horizontal windows of the row above it
+PLAYABLE_WINDOWS = [[[] for _ in range(COLUMN_COUNT)] for _ in range(ROW_COUNT)]
+for _w, _cells in enumerate(WINDOWS):
+    if IS_HORIZONTAL[_w]:
+        for _r, _c in _cells:
+            if _r + 1 < ROW_COUNT:
+                PLAYABLE_WINDOWS[_r + 1][_c].append(_w)
+
+
+def _threat_windows(r, c):
+    windows = []
+    if c <= COLUMN_COUNT - 4:
+        windows.append(tuple((r, c + i) for i in range(1, WINDOW_LENGTH)))
+    # The vertical window below an open cell is always full, so it can
+    # never hold a threat and is left out.
+    if c <= COLUMN_COUNT - 4 and r <= ROW_COUNT - 4:
+        windows.append(tuple((r + i, c + i) for i in range(1, WINDOW_LENGTH)))
+    if c >= 3 and r <= ROW_COUNT - 4:
+        windows.append(tuple((r + i, c - i) for i in range(1, WINDOW_LENGTH)))
+    return tuple(windows)
+
+
+# THREAT_WINDOWS[r][c]: for every window the threat scan checks when a
+# disc is tried on open cell (r, c), the other three cells of that window
+THREAT_WINDOWS = [[_threat_windows(r, c) for c in range(COLUMN_COUNT)] for r in range(ROW_COUNT)]
+
+# THREAT_DEPENDENTS[r][c]: open cells whose threat scan reads cell (r, c)
+THREAT_DEPENDENTS = [[[] for _ in range(COLUMN_COUNT)] for _ in range(ROW_COUNT)]
+for _r in range(ROW_COUNT):
+    for _c in range(COLUMN_COUNT):
+        for _cells in THREAT_WINDOWS[_r][_c]:
+            for _tr, _tc in _cells:
+                if (_r, _c) not in THREAT_DEPENDENTS[_tr][_tc]:
+                    THREAT_DEPENDENTS[_tr][_tc].append((_r, _c))
+
+
+def winning_move(board, piece):
+    if isinstance(board, np.ndarray):
+        board = board.tolist()
+    for cells in WINDOWS:
+        for r, c in cells:
+            if board[r][c] != piece:
+                break
+        else:
+            return True
+    return False